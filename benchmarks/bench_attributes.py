@@ -0,0 +1,244 @@
+""" Parses attribute-heavy tags (forms, data attributes) with the regex scanner in
+AttributeParser and with the character by character state machine it replaced.
+
+python -m benchmarks.bench_attributes
+"""
+
+import timeit
+
+from collections import OrderedDict
+
+from hamplify.config import *
+from hamplify.parsers.attributes import Attribute, AttributeParser
+from hamplify.parsers.base import BaseParser
+
+class AttributeParseState(object):
+  """ The state of a single call to AttributeParser.parse
+  """
+
+  def __init__(self):
+    self.attrs = OrderedDict()
+    self.cur_attr = Attribute()
+    self.buffer = ""
+    self.char = None
+    self.length = 0
+    self.pos = 0
+    self.state = None
+    self.value_type = str
+    self.quote_char = None
+
+class LegacyAttributeParser(BaseParser):
+  """ The character by character state machine that AttributeParser used to be
+  """
+
+  STATE_DONE = 0
+  STATE_PRE_NAME_WS = 1
+  STATE_ATTR_NAME = 2
+  STATE_POST_NAME_WS = 3
+  STATE_PRE_VALUE_WS = 4
+  STATE_VALUE = 5
+
+  def __init__(self, options=None):
+    super(LegacyAttributeParser, self).__init__(options)
+
+  def parse(self, text):
+    """ Parses an attribute string, returning a 2-tuple of the attributes as a dictionary,
+    and whatever text was remaining after the attributes.
+
+    e.g. parse('(type="text" required)')
+
+    returns ({"type": "text", "required": None}, "")
+    """
+
+    s = AttributeParseState()
+    s.state = self.STATE_PRE_NAME_WS
+
+    s.length = len(text)
+    s.char = text[s.pos]
+
+    # This parser expects to the string to start right at the attributes
+    if s.char != TOKEN_ATTR_WRAPPER[0]:
+      raise ParseError("Expected a space or '%s', but found '%s' instead." % (TOKEN_ATTR_WRAPPER[0], s.char))
+
+    s.pos += 1
+
+    # Iterate through each character, changing states as we progress
+    while s.state != self.STATE_DONE and s.pos < s.length:
+      s.char = text[s.pos]
+
+      if s.state == self.STATE_PRE_NAME_WS:
+        self._parse_pre_name_whitespace(s)
+      elif s.state == self.STATE_ATTR_NAME:
+        self._parse_attr_name(s)
+      elif s.state == self.STATE_POST_NAME_WS:
+        self._parse_post_name_whitespace(s)
+      elif s.state == self.STATE_PRE_VALUE_WS:
+        self._parse_pre_value_whitespace(s)
+      elif s.state == self.STATE_VALUE:
+        self._parse_value(s)
+
+      s.pos += 1
+
+    if s.state != self.STATE_DONE:
+      raise ParseError("Reached EOL while parsing attributes")
+
+    return (s.attrs, text[s.pos:])
+
+  def push_attr(self, s):
+    """ Adds a new attribute to the dictionary. If this is called before a value is
+    set, the value will be None
+    """
+
+    val = None
+
+    # The attribute has already been set
+    if s.cur_attr.name in s.attrs:
+      raise ParseError("Found duplicate attribute: %s" % s.cur_attr.name)
+
+    max_attributes = self.options.get("max_attributes")
+
+    if max_attributes is not None and len(s.attrs) >= max_attributes:
+      raise ParseError("Tag has too many attributes (more than %d)" % max_attributes)
+
+    if s.cur_attr.value is not None:
+      s.cur_attr.value = s.value_type(s.cur_attr.value)
+
+    s.attrs[s.cur_attr.name] = s.cur_attr
+    s.cur_attr = Attribute()
+    s.quote_char = None
+    s.value_type = str
+    s.buffer = ""
+
+  def _parse_pre_name_whitespace(self, s):
+    """ Skip whitespace and change states once we hit some characters that 
+    could be for an attribute name
+
+     vv        v
+    (  href="#" target="_blank")
+    """
+
+    if s.char == " ":
+      return
+
+    if 'a' <= s.char.lower() <= 'z' or s.char == "-":
+      s.state = self.STATE_ATTR_NAME
+      s.buffer += s.char
+    elif s.char == TOKEN_ATTR_WRAPPER[1]:
+      s.state = self.STATE_DONE
+    else:
+      raise ParseError("Unexpected character while parsing attribute name: '%s'" % s.char)
+
+  def _parse_attr_name(self, s):
+    """ Parses an attribute name, building up the buffer as it reads in characters.
+    Once a non-attribute character is hit, the buffer is dumped into attr_name.
+    """
+
+    if 'a' <= s.char.lower() <= 'z' or s.char == "-":
+      s.buffer += s.char
+    else:
+      s.cur_attr.name = s.buffer
+
+      if s.char == " ":
+        s.state = self.STATE_POST_NAME_WS
+      elif s.char == TOKEN_ATTR_SETVAL:
+        s.state = self.STATE_PRE_VALUE_WS
+        s.buffer = ""
+      elif s.char == TOKEN_ATTR_WRAPPER[1]:
+        s.state = self.STATE_DONE
+        self.push_attr(s)
+      else:
+        raise ParseError("Unexpected character while parsing attribute name: '%s'" % s.char)
+
+  def _parse_post_name_whitespace(self, s):
+    """ Skips whitespace after the attribute name until:
+
+    - An equal sign is found (which means this attribute has a value)
+    - Attribute chars are found (which means no value, and another attribute)
+    """
+
+    if s.char == " ":
+      return
+
+    if 'a' <= s.char.lower() <= 'z' or s.char == "-":
+      self.push_attr(s)
+      s.state = self.STATE_ATTR_NAME
+      s.buffer += s.char
+    elif s.char == TOKEN_ATTR_SETVAL:
+      s.state = self.STATE_PRE_VALUE_WS
+      s.buffer = ""
+    elif s.char == TOKEN_ATTR_WRAPPER[1]:
+      s.state = self.STATE_DONE
+      self.push_attr(s)
+    else:
+      raise ParseError("Unexpected character while parsing: '%s'" % s.char)
+
+  def _parse_pre_value_whitespace(self, s):
+    """ Skips whitespace before a value. If a character or quote is encountered, then the
+    value is set to be a string. Otherwise the value is set to be an int
+    """
+
+    if s.char == " ":
+      return
+
+    if s.char == "\"":
+      s.cur_attr.quote_char = "\""
+      s.quote_char = "\""
+      s.state = self.STATE_VALUE
+    elif s.char == "\'":
+      s.cur_attr.quote_char = "\'"
+      s.quote_char = "\'"
+      s.state = self.STATE_VALUE
+    elif '0' <= s.char <= '9':
+      s.value_type = int
+      s.buffer += s.char
+      s.state = self.STATE_VALUE
+    elif s.char == TOKEN_ATTR_WRAPPER[1]:
+      raise ParseError("Unexpected end of attributes (do you have an extra equals sign?)")
+    else:
+      raise ParseError("Unexpected character while parsing: '%s'" % s.char)
+
+  def _parse_value(self, s):
+    """ Parses the attribute's value. If the value is wrapped in quotes, extract
+    every character until we hit the closing quote. If it's a number, extract values
+    until we hit a space/other boundary
+    """
+
+    # If we hit the other quote char, or there was no quote char and we just hit some whitespace
+    if s.char == s.quote_char or s.char == " " and not s.quote_char:
+      s.state = self.STATE_PRE_NAME_WS
+      s.cur_attr.value = s.buffer
+      self.push_attr(s)
+    elif not s.quote_char and s.char == TOKEN_ATTR_WRAPPER[1]:
+      s.state = self.STATE_DONE
+      s.cur_attr.value = s.buffer
+      self.push_attr(s)
+    elif not ('0' <= s.char <= '9') and s.value_type == int:
+      raise ParseError("String attributes must be surrounded with quotes")
+    else:
+      s.buffer += s.char
+
+LINES = [
+  '(type="text" name="first_name" id="first-name" class="form-control input-lg" placeholder="First name" required autofocus)',
+  "(data-toggle='collapse' data-target='#nav' aria-controls='nav' aria-expanded='false' aria-label='Toggle navigation')",
+  '(rows=10 cols=80 maxlength=2000 name="comment" data-autosize data-counter="comment-count")',
+  '(  href = "/a/very/long/url/with/a/lot/of/parts?and=some&query=parameters"  target="_blank"  rel="noopener noreferrer"  )',
+]
+
+def main():
+  old = LegacyAttributeParser()
+  new = AttributeParser()
+
+  for line in LINES:
+    assert ([a.render() for a in old.parse(line)[0].values()]
+      == [a.render() for a in new.parse(line)[0].values()])
+
+  number = 20000
+  size = sum(len(line) for line in LINES) * number
+
+  for name, parser in (("state machine", old), ("scanner", new)):
+    seconds = min(timeit.repeat(lambda: [parser.parse(line) for line in LINES], number=number, repeat=3))
+    print("%-13s  %7.1f ms  %6.2f MB/s  %8d lines/s"
+      % (name, seconds * 1000, size / seconds / 1e6, len(LINES) * number / seconds))
+
+if __name__ == "__main__":
+  main()
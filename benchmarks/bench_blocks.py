@@ -0,0 +1,53 @@
+""" Parses wide templates where a single element has thousands of children, most
+of them if/elif/else chains. Linking each block used to scan back through every
+child of its parent.
+
+python -m benchmarks.bench_blocks
+"""
+
+import timeit
+
+from hamplify.config import ENGINE_DJANGO
+from hamplify.element import Text
+from hamplify.parsers.parser import Parser
+
+def make_template(rows):
+  lines = ["%table"]
+
+  for i in range(rows):
+    lines.append("  - if row_%d.active" % i)
+    lines.append("    %tr.active= row_{0}".format(i))
+    lines.append("  - elif row_%d.hidden" % i)
+    lines.append("    %tr.hidden")
+    lines.append("")
+    lines.append("  - else")
+    lines.append("    %tr= row_{0}".format(i))
+
+  return "\n".join(lines)
+
+class ScanningParser(Parser):
+  """ Finds the sibling for a block the way it was done before Node.last_child
+  """
+
+  def _get_newest_child(self, ctx):
+    for child in ctx.cursor.children[::-1]:
+      if type(child) is Text and child.is_empty():
+        continue
+      else:
+        return child
+
+    return None
+
+def main():
+  options = {"engine": ENGINE_DJANGO}
+
+  for rows in (500, 1000, 2000, 4000):
+    template = make_template(rows)
+    old = min(timeit.repeat(lambda: ScanningParser(options).parse(template), number=1, repeat=3))
+    new = min(timeit.repeat(lambda: Parser(options).parse(template), number=1, repeat=3))
+
+    print("%5d rows (%6d children)  scan %8.1f ms  last_child %6.1f ms  (%.1fx)"
+      % (rows, rows * 4, old * 1000, new * 1000, old / new))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,75 @@
+""" Compares the first-character dispatch in Parser._parse_line against the old
+chain of startswith checks, on a large template made up mostly of plaintext.
+
+python -m benchmarks.bench_dispatch
+"""
+
+import timeit
+
+from hamplify.config import *
+from hamplify.element import Text
+from hamplify.parsers.parser import ParseContext, Parser
+
+def make_template(sections=2000):
+  lines = []
+
+  for i in range(sections):
+    lines.append(".section-%d" % i)
+    lines.append("  %h2 Section title")
+
+    for j in range(8):
+      lines.append("  Some plain text for line %d of section %d" % (j, i))
+
+    lines.append("  -# a comment")
+
+  return "\n".join(lines)
+
+def parse_line_cascade(parser, ctx, line):
+  """ The line classification used before the dispatch table was added
+  """
+
+  for t in COMMENT_TOKENS:
+    if line.startswith(t):
+      return parser.comment_parser.parse(line)
+
+  for t in TAG_TOKENS:
+    if line.startswith(t):
+      return parser.tag_parser.parse(line)
+
+  if parser.options.get("engine") and line.startswith(TOKEN_BLOCK):
+    return parser.block_parser.parse(line, parser._get_newest_child(ctx))
+
+  if line.startswith(TOKEN_DOCTYPE):
+    return parser.doctype_parser.parse(line)
+
+  if line.startswith(TOKEN_FILTER):
+    return parser.filter_parser.parse(line)
+
+  return Text(line)
+
+def main():
+  parser = Parser({"engine": ENGINE_JINJA})
+  ctx = ParseContext()
+  lines = [l.strip() for l in make_template().split("\n")]
+  text_lines = [l for l in lines if l[0] not in "%.#-/!:"]
+
+  def run(fn, items):
+    for l in items:
+      fn(l)
+
+  cascade = lambda l: parse_line_cascade(parser, ctx, l)
+  dispatch = lambda l: parser._parse_line(ctx, l)
+
+  for name, items in (("all lines", lines), ("text lines", text_lines)):
+    old = min(timeit.repeat(lambda: run(cascade, items), number=5, repeat=3))
+    new = min(timeit.repeat(lambda: run(dispatch, items), number=5, repeat=3))
+
+    print("%-12s %7d lines  cascade %.1f ms  dispatch %.1f ms  (%.2fx)"
+      % (name, len(items), old * 200, new * 200, old / new))
+
+  template = make_template()
+  full = min(timeit.repeat(lambda: parser.parse(template), number=3, repeat=3))
+  print("full parse   %7d lines  %.1f ms" % (len(lines), full / 3 * 1000))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,85 @@
+""" Measures how much memory a tree with a million nodes takes. The "dict" numbers
+use subclasses without __slots__ that allocate an empty attribute dict and class
+list for every tag, which is how elements were laid out before.
+
+python -m benchmarks.bench_memory
+"""
+
+import gc
+import time
+import tracemalloc
+
+from collections import OrderedDict
+
+from hamplify.element import RootNode, SelfClosingTag, Tag, Text
+
+class DictTag(Tag):
+  def __init__(self):
+    super(DictTag, self).__init__()
+
+    self.attrs = OrderedDict()
+    self.classes = []
+
+class DictSelfClosingTag(SelfClosingTag):
+  def __init__(self):
+    super(DictSelfClosingTag, self).__init__()
+
+    self.attrs = OrderedDict()
+    self.classes = []
+
+class DictText(Text):
+  pass
+
+def build(nodes, tag_class, self_closing_class, text_class):
+  """ Builds a tree of rows, each with a few tags and some text
+  """
+
+  root = RootNode()
+  count = 0
+
+  while count < nodes:
+    row = tag_class()
+    row.tag = "tr"
+    root.add_child(row)
+
+    for i in range(3):
+      cell = tag_class()
+      cell.tag = "td"
+      cell.add_child(text_class("cell %d" % i))
+      row.add_child(cell)
+
+    br = self_closing_class()
+    br.tag = "br"
+    row.add_child(br)
+
+    count += 8
+
+  return root, count
+
+def measure(nodes, *classes):
+  gc.collect()
+  tracemalloc.start()
+
+  start = time.time()
+  root, count = build(nodes, *classes)
+  elapsed = time.time() - start
+
+  size = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+
+  return size, count, elapsed
+
+def main():
+  nodes = 1000000
+
+  for name, classes in (
+    ("dict", (DictTag, DictSelfClosingTag, DictText)),
+    ("slots", (Tag, SelfClosingTag, Text)),
+  ):
+    size, count, elapsed = measure(nodes, *classes)
+
+    print("%-5s  %d nodes  %7.1f MB  %5.1f bytes/node  built in %.2f s"
+      % (name, count, size / 1048576.0, size / float(count), elapsed))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,84 @@
+""" Parses a large template with Parser.parse_parallel and compares it to a normal
+parse. Getting the elements back from the workers is also timed on its own:
+
+pickled: Unpickling the elements as they are, the way the workers used to send them
+paused:  The same, with the garbage collector paused
+packed:  Unpickling and unpacking a PackedElements with the garbage collector paused,
+         which is what parse_parallel does now
+
+Timings depend a lot on how many cores there are; with one core parse_parallel can
+only be slower than parse.
+
+python -m benchmarks.bench_parallel
+"""
+
+import gc
+import multiprocessing
+import pickle
+import timeit
+
+from hamplify.config import ENGINE_DJANGO
+from hamplify.packing import PackedElements
+from hamplify.parsers.parser import Parser
+
+SECTION = """%div.row#r{n}(data-n="{n}")
+  %h2.title Section {n}
+  - if user.is_admin
+    %a.btn(href="/edit/{n}") Edit
+  - else
+    %span.muted read only
+  %ul.items
+    - for item in items_{n}
+      %li.item(data-id="{{{{ item.id }}}}")
+        %span.name= item.name
+        %span.price= item.price
+  :javascript
+    init({n});
+  %p
+    Some text about section {n}
+    that goes over a few lines
+"""
+
+def make_template(sections):
+  return "".join(SECTION.format(n=i) for i in range(sections))
+
+def best(func):
+  return min(timeit.repeat(func, number=1, repeat=3))
+
+def paused(func):
+  def run():
+    gc.disable()
+
+    try:
+      func()
+    finally:
+      gc.enable()
+
+  return run
+
+def main():
+  # The line cache would make every parse after the first one mostly lookups
+  options = {"engine": ENGINE_DJANGO, "line_cache_size": 0}
+  parser = Parser(options)
+
+  print("%d cores" % multiprocessing.cpu_count())
+
+  for sections in (1000, 5000, 20000):
+    template = make_template(sections)
+    children = parser.parse(template).children
+
+    serial = best(lambda: parser.parse(template))
+    parallel = best(lambda: parser.parse_parallel(template))
+
+    plain = pickle.dumps(children, -1)
+    packed = pickle.dumps(PackedElements.pack(children), -1)
+    unpickle = best(lambda: pickle.loads(plain))
+    unpickle_paused = best(paused(lambda: pickle.loads(plain)))
+    unpack = best(paused(lambda: pickle.loads(packed).unpack()))
+
+    print("%6d lines  parse %5.0f ms  parse_parallel %5.0f ms  |  pickled %5.0f ms  paused %5.0f ms"
+      "  packed %5.0f ms  (%d KB -> %d KB)" % (template.count("\n"), serial * 1000, parallel * 1000,
+      unpickle * 1000, unpickle_paused * 1000, unpack * 1000, len(plain) // 1024, len(packed) // 1024))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,163 @@
+""" Parses tag lines with the offset based head scanner in TagParser and with the
+slicing parser it replaced. Both run without the line cache, so every line is
+parsed in full.
+
+python -m benchmarks.bench_tags
+"""
+
+import re
+import timeit
+
+from hamplify.config import *
+from hamplify.element import SelfClosingTag, Tag, Text
+from hamplify.parsers.tags import TagParser
+
+regex_tag_name = re.compile(r'([a-zA-Z][a-zA-Z0-9\-]*)')
+regex_class_id = re.compile(r'(?:\.|#)([a-zA-Z0-9_-]*)')
+
+class SlicingTagParser(TagParser):
+  """ Parses the tag head the way TagParser used to, slicing off each part of it
+  """
+
+  def _parse(self, tag, text):
+    """ Parses a tag and any immediate text contents. If `tag` is None, the tag name
+    is parsed from the text.
+
+    %p.style#id Lorem ipsum
+
+    Produces: <p class="style" id="id">Lorem ipsum</p>
+    """
+
+    if tag is None:
+      tag, text = self._parse_tag_name(text)
+
+    text = self._parse_id(tag, text)
+    text = self._parse_classes(tag, text)
+    text = self._parse_id(tag, text, True)
+    self._parse_attributes(tag, text)
+    tag.freeze()
+
+    return tag
+
+  def _parse_tag_name(self, text):
+    """ Extracts the tag name and strips it from the text. Returns the new tag
+    and the remaining text.
+
+    [%p]#id.style#id
+    """
+
+    # Remove the tag token
+    text = text[len(TOKEN_TAG):]
+
+    if not text:
+      raise ParseError("Encountered a blank tag, expected a name")
+
+    tag_name = regex_tag_name.match(text)
+
+    if not tag_name:
+      raise ParseError("Expected a name for the tag, but instead found '%s'" % text[0])
+
+    tag_name = tag_name.group(1)
+
+    if tag_name.lower() in SELF_CLOSING_TAGS:
+      tag = SelfClosingTag()
+    else:
+      tag = Tag()
+
+    tag.tag = tag_name
+
+    return tag, text[len(tag_name):]
+
+  def _parse_classes(self, tag, text):
+    """ Extracts a list of classes (if any)
+
+    %p#id[.style]#id
+    """
+
+    while text and text.startswith(TOKEN_CLASS):
+      class_name = regex_class_id.match(text)
+      class_name = class_name.group(1)
+
+      if not class_name:
+        raise ParseError("Encountered an empty class name")
+
+      tag.add_class(class_name)
+      text = text[len(class_name)+1:]
+
+    return text
+
+  def _parse_id(self, tag, text, end=False):
+    """ Extracts an ID for the element (if it has one). The ID can come at the beginning
+    or the end of the tag definition. If at the beginning, no classes may come before it.
+    If at the end, no classes may come after it.
+
+    %p[#id].style[#id]
+    """
+
+    while text and text.startswith(TOKEN_ID):
+      # An ID was already set
+      if tag.id:
+        raise ParseError("Element cannot have more than 1 ID")
+
+      id_name = regex_class_id.match(text)
+      id_name = id_name.group(1)
+
+      if not id_name:
+        raise ParseError("Encountered an empty ID")
+
+      tag.id = id_name
+      text = text[len(id_name) + len(TOKEN_ID):]
+
+    # The ID can be at the start or the end
+    if text and end and text.startswith(TOKEN_CLASS):
+      raise ParseError("Encountered a class after an ID (must be either before or after all of the classes)")
+
+    return text
+
+  def _parse_attributes(self, tag, text):
+    if not text:
+      return
+
+    if text.startswith(TOKEN_ATTR_WRAPPER[0]):
+      (attrs, text) = self.ap.parse(text)
+
+      tag.attrs = attrs
+
+      if text.strip():
+        # '= var' found immediately after the tag
+        if text.startswith(TOKEN_VARIABLE):
+          tag.add_child(self.vp.parse(text))
+        else:
+          tag.add_child(Text(text.lstrip()))
+    elif text.startswith(" "):
+      tag.add_child(Text(text.lstrip()))
+    elif text.startswith(TOKEN_VARIABLE):
+      tag.add_child(self.vp.parse(text))
+    else:
+      raise ParseError("Expected a '%s' or whitespace" % TOKEN_ATTR_WRAPPER[0])
+
+LINES = [
+  "%p.lead#intro " + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 8,
+  ".col-md-6.col-sm-12.text-center.hidden-xs",
+  "%a.btn.btn-primary#signup(href=\"/signup\" title=\"Sign up\") Sign up for an account today",
+  "%input#email.form-control(type=\"email\" name=\"email\" required)",
+  "%BR",
+  "%span.label= user.name",
+]
+
+def main():
+  options = {"engine": ENGINE_DJANGO, "line_cache_size": 0}
+  old = SlicingTagParser(options)
+  new = TagParser(options)
+
+  for line in LINES:
+    assert old.parse(line).render() == new.parse(line).render()
+
+  number = 20000
+
+  for name, parser in (("slicing", old), ("offsets", new)):
+    seconds = min(timeit.repeat(lambda: [parser.parse(line) for line in LINES], number=number, repeat=3))
+    print("%-8s  %7.1f ms  %8d lines/s" % (name, seconds * 1000, len(LINES) * number / seconds))
+
+if __name__ == "__main__":
+  main()
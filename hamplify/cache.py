@@ -0,0 +1,107 @@
+import hashlib, threading
+
+from collections import OrderedDict
+
+from hamplify.config import CONTENT_CACHE_SIZE, LINE_CACHE_SIZE
+
+class ContentCache(object):
+  """ Remembers the result of calling a function on a piece of text, so that the same
+  text is only ever processed once. Results are keyed by the function and a hash of
+  the text, so the cache doesn't hold on to the text itself. Only the most recently
+  used `size` results are kept.
+
+  A cache can be shared between threads.
+  """
+
+  def __init__(self, size=CONTENT_CACHE_SIZE):
+    self.size = size
+    self.results = OrderedDict()
+    self.lock = threading.Lock()
+
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, func, text):
+    """ Returns func(text), calling func only if it hasn't been called with the same
+    text before
+    """
+
+    data = text if isinstance(text, bytes) else text.encode("utf-8")
+    key = (func, hashlib.sha1(data).digest())
+
+    with self.lock:
+      if key in self.results:
+        # Move it to the end, so it's the last to be evicted
+        result = self.results.pop(key)
+        self.results[key] = result
+        self.hits += 1
+
+        return result
+
+      self.misses += 1
+
+    # Done outside of the lock. Two threads could end up doing the same work, but
+    # they'll both get the same result
+    result = func(text)
+
+    with self.lock:
+      self.results[key] = result
+
+      while len(self.results) > self.size:
+        self.results.popitem(last=False)
+
+    return result
+
+  def clear(self):
+    with self.lock:
+      self.results.clear()
+
+class LineCache(object):
+  """ Remembers the elements parsed from the most recently used `size` lines. Elements
+  are stored as prototypes that are never handed out, get returns a copy.
+
+  A cache can be shared between threads.
+  """
+
+  def __init__(self, size=LINE_CACHE_SIZE):
+    self.size = size
+    self.lines = OrderedDict()
+    self.lock = threading.Lock()
+
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, line):
+    """ Returns a copy of the element parsed from `line`, or None if it isn't cached.
+    `line` can be anything hashable, e.g. the text of the line along with the options
+    it was parsed with
+    """
+
+    with self.lock:
+      prototype = self.lines.pop(line, None)
+
+      if prototype is None:
+        self.misses += 1
+        return None
+
+      # Move it to the end, so it's the last to be evicted
+      self.lines[line] = prototype
+      self.hits += 1
+
+    return prototype.clone()
+
+  def put(self, line, element):
+    """ Caches a copy of the element parsed from `line`
+    """
+
+    prototype = element.clone()
+
+    with self.lock:
+      self.lines[line] = prototype
+
+      while len(self.lines) > self.size:
+        self.lines.popitem(last=False)
+
+  def clear(self):
+    with self.lock:
+      self.lines.clear()
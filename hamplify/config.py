@@ -13,6 +13,7 @@ TOKEN_VARIABLE = "="
 TAG_TOKENS = (TOKEN_TAG, TOKEN_CLASS, TOKEN_ID)
 COMMENT_TOKENS = (TOKEN_HTML_COMMENT, TOKEN_COMMENT)
 INDENTATION = (" ", "\t")
+INDENTATION_CHARS = "".join(INDENTATION)
 
 ENGINE_DJANGO = "django"
 ENGINE_JINJA = "jinja"
@@ -22,8 +23,17 @@ FILTER_PLAIN = "plain"
 FILTER_JAVASCRIPT = ("javascript", "js")
 FILTER_CSS = ("css", "style", "stylesheet")
 
-# List of tags which are considered self closing
-SELF_CLOSING_TAGS = (
+# Default size (in characters) of the chunks yielded by Element.iter_render
+RENDER_CHUNK_SIZE = 8192
+
+# Default number of tag lines the TagParser keeps parsed copies of
+LINE_CACHE_SIZE = 4096
+
+# Default number of minified or compiled filter bodies the Parser keeps
+CONTENT_CACHE_SIZE = 1024
+
+# Set of tags which are considered self closing
+SELF_CLOSING_TAGS = frozenset((
   "area",
   "base",
   "br",
@@ -39,8 +49,8 @@ SELF_CLOSING_TAGS = (
   "param",
   "source",
   "track",
-  "wbr"
-)
+  "wbr",
+))
 
 """ These are blocks specific to Jinja/Django. They are rendered as {% ... %}{% ... %}
 
@@ -94,6 +104,8 @@ JINJA_BLOCKS = (
 
 class ParseError(Exception):
   def __init__(self, message, line_number=None, col=None, line=None, file_path=None):
+    super(ParseError, self).__init__(message)
+
     self.col = col
     self.line = line
     self.line_number = line_number
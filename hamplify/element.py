@@ -1,16 +1,93 @@
+import itertools
+
+from array import array
 from collections import OrderedDict
 
-from hamplify.config import ParseError
+from hamplify.config import ParseError, RENDER_CHUNK_SIZE
+from hamplify.parsers.attributes import Attribute
+
+def is_significant(e):
+  """ Returns False for elements that don't affect the elements around them: blank lines
+  and comments that aren't rendered. Blocks like elif/else are linked to the last
+  significant element before them.
+  """
+
+  if type(e) is Text:
+    return not e.is_empty()
+
+  return not (isinstance(e, Comment) and not e.render_children)
+
+# The names of every slot in each element class, used for copying elements
+_slot_names = {}
+
+def _get_slot_names(cls):
+  names = _slot_names.get(cls)
+
+  if names is None:
+    names = _slot_names[cls] = tuple(
+      name for c in cls.__mro__ for name in c.__dict__.get("__slots__", ()))
+
+  return names
 
 class Element(object):
-  """ Base element
+  """ Base element. Elements use __slots__ since a tree can have a huge number of
+  them, so subclasses need to declare any attributes they add.
   """
 
-  depth = 0
-  parent = None
+  __slots__ = ("depth", "parent", "line_start", "line_end")
 
   def __init__(self):
-    super(Element, self).__init__()
+    self.depth = 0
+    self.parent = None
+
+    # The first and last line (inclusive) of the source that this element and its
+    # children were parsed from. These are None if the element wasn't made by the parser
+    self.line_start = None
+    self.line_end = None
+
+  def clone(self):
+    """ Returns a copy of this element and everything under it. The copy doesn't have
+    a parent
+    """
+
+    root = self._copy()
+
+    # Copied blocks that are linked to another block need to be linked to its copy
+    copies = {}
+    stack = [(self, root)]
+
+    while stack:
+      e, copy = stack.pop()
+
+      if isinstance(e, Block):
+        copies[e] = copy
+
+      if isinstance(e, Node):
+        for child in e.children:
+          child_copy = child._copy()
+          copy.add_child(child_copy)
+          stack.append((child, child_copy))
+
+    for copy in copies.values():
+      if copy.linked_to in copies:
+        copy.linked_to = copies[copy.linked_to]
+
+    return root
+
+  def _copy(self):
+    """ Returns a shallow copy of the element, without a parent
+    """
+
+    cls = type(self)
+    copy = cls.__new__(cls)
+
+    for name in _get_slot_names(cls):
+      setattr(copy, name, getattr(self, name))
+
+    copy.parent = None
+    copy.depth = 0
+
+    return copy
 
   def set_parent(self, parent):
     self.parent = parent
@@ -26,37 +103,208 @@ class Element(object):
 
     return ""
 
+  def render_to(self, write):
+    """ Renders the element by calling `write` with each piece of text, e.g. a file's
+    write method or a list's append method
+    """
+
+    write(self.render())
+
+  def _changed(self):
+    """ Called after the element is changed. Clears the memoized html of the nodes above
+    it (see Node.enable_memoization). A node that's already cleared has had every node
+    above it cleared too, so there's no need to go any further than that.
+    """
+
+    node = self.parent
+
+    while node is not None and node._memo is not None and node._memo is not False:
+      node._memo = None
+      node = node.parent
+
+  def iter_render(self, chunk_size=RENDER_CHUNK_SIZE):
+    """ Renders the element as a series of chunks. Each chunk is at least `chunk_size`
+    characters long, except for the last one. The tree is walked with a stack instead
+    of recursion, so there's no limit on how deeply elements can be nested.
+    """
+
+    stack = [iter(self._iter_parts())]
+    buffer = []
+    size = 0
+
+    while stack:
+      for part in stack[-1]:
+        if isinstance(part, Element):
+          stack.append(iter(part._iter_parts()))
+          break
+
+        buffer.append(part)
+        size += len(part)
+
+        if size >= chunk_size:
+          yield "".join(buffer)
+          buffer = []
+          size = 0
+      else:
+        stack.pop()
+
+    if buffer:
+      yield "".join(buffer)
+
+  def _iter_parts(self):
+    """ Returns the text of the element, split into strings and child elements. Used
+    by iter_render to render the element without recursing
+    """
+
+    buffer = []
+    self.render_to(buffer.append)
+
+    return buffer
+
 class Node(Element):
   """ An element that can have children
   """
 
+  __slots__ = ("children", "last_child", "render_children", "_memo")
+
   def __init__(self):
     super(Node, self).__init__()
 
     self.children = []
 
+    # The most recently added significant child. This is what blocks like
+    # elif/else get linked to
+    self.last_child = None
+
     # Whether this element's children should be rendered
     self.render_children = True
 
+    # The memoized html of this node. False if memoization is off, and None if the
+    # html needs to be rendered again
+    self._memo = False
+
   def add_child(self, e):
     self.children.append(e)
     e.set_parent(self)
 
+    if is_significant(e):
+      self.last_child = e
+
+    if self._memo is not False:
+      if isinstance(e, Node):
+        e.enable_memoization()
+
+      self._changed()
+
     return self
 
+  def remove_child(self, e):
+    self.children.remove(e)
+    e.parent = None
+
+    if e is self.last_child:
+      self._update_last_child()
+
+    self._changed()
+
+    return self
+
+  def replace_child(self, old, new):
+    self.children[self.children.index(old)] = new
+    old.parent = None
+    new.set_parent(self)
+
+    if old is self.last_child or is_significant(new):
+      self._update_last_child()
+
+    if self._memo is not False and isinstance(new, Node):
+      new.enable_memoization()
+
+    self._changed()
+
+    return self
+
+  def _copy(self):
+    copy = super(Node, self)._copy()
+    copy.children = []
+    copy.last_child = None
+
+    if copy._memo is not False:
+      copy._memo = None
+
+    return copy
+
+  def enable_memoization(self):
+    """ Remembers the html of this node and every node under it the first time they're
+    rendered. Changing an element through its methods (add_child, set_text, add_class,
+    set_attribute, ...) clears the html of every node above it, so rendering again only
+    has to redo the path from the root down to the elements that changed.
+
+    Changing an element's fields directly doesn't clear anything.
+    """
+
+    stack = [self]
+
+    while stack:
+      node = stack.pop()
+
+      if node._memo is False:
+        node._memo = None
+
+      stack.extend(e for e in node.children if isinstance(e, Node))
+
+  def _changed(self):
+    if self._memo is not None and self._memo is not False:
+      self._memo = None
+      super(Node, self)._changed()
+
+  def _update_last_child(self):
+    self.last_child = None
+
+    for e in reversed(self.children):
+      if is_significant(e):
+        self.last_child = e
+        break
+
   def render(self):
     """ Renders this element, followed by its children, followed by any post rendering.
     All rendering code should go in _pre_render and _post_render.
     """
 
-    text = self._pre_render()
+    buffer = []
+    self.render_to(buffer.append)
+
+    return "".join(buffer)
+
+  def render_to(self, write):
+    if self._memo is False:
+      self._render_to(write)
+      return
+
+    if self._memo is None:
+      buffer = []
+      self._render_to(buffer.append)
+      self._memo = "".join(buffer)
+
+    write(self._memo)
+
+  def _render_to(self, write):
+    write(self._pre_render())
 
     if self.render_children:
-      text += self._render_children()
-    
-    text += self._post_render()
+      self._render_children_to(write)
 
-    return text
+    write(self._post_render())
+
+  def _iter_parts(self):
+    # Memoized html is used, but iter_render doesn't memoize anything
+    if self._memo is not None and self._memo is not False:
+      return (self._memo,)
+
+    if not self.render_children:
+      return (self._pre_render(), self._post_render())
+
+    return itertools.chain((self._pre_render(),), self.children, (self._post_render(),))
 
   def _pre_render(self):
     """ Renders the element before its children are rendered
@@ -74,12 +322,14 @@ class Node(Element):
     """ Renders each child
     """
 
-    text = ""
+    buffer = []
+    self._render_children_to(buffer.append)
 
-    for e in self.children:
-      text += e.render()
+    return "".join(buffer)
 
-    return text
+  def _render_children_to(self, write):
+    for e in self.children:
+      e.render_to(write)
 
   def _parse_children(self):
     """ Whether this element should have its children parsed
@@ -88,9 +338,18 @@ class Node(Element):
     return True
 
 class RootNode(Node):
+  __slots__ = ("ws_char", "ws_per_indent")
+
   def __init__(self):
     super(RootNode, self).__init__()
 
+    self.line_start = 1
+    self.line_end = 0
+
+    # The indentation that was used in the source
+    self.ws_char = None
+    self.ws_per_indent = None
+
   def set_parent(self, parent):
     raise Exception("Called set_parent on root node")
 
@@ -98,6 +357,8 @@ class Text(Element):
   """ Plaintext element with no children
   """
 
+  __slots__ = ("text",)
+
   def __init__(self, text=""):
     super(Text, self).__init__()
 
@@ -106,6 +367,10 @@ class Text(Element):
   def render(self):
     return self.text
 
+  def set_text(self, text):
+    self.text = text
+    self._changed()
+
   def is_empty(self):
     return len(self.text.strip()) == 0
 
@@ -113,33 +378,109 @@ class Variable(Text):
   """ A jinja/django variable written with as '= var'
   """
 
+  __slots__ = ()
+
   def render(self):
     return "{{%s}}" % self.text
 
 class Filter(Node):
   """ The contents of a filter are not parsed. The text is instead just
   printed out verbatim. 
+
+  Lines can be added either as Text children, or as (start, end) offsets into the
+  source the filter was parsed from. The parser uses offsets when it has the whole
+  source, so a long filter doesn't need an object and a copy of the text for every
+  line. Text children are rendered before the offsets.
   """
 
+  __slots__ = ("source", "spans")
+
+  def __init__(self):
+    super(Filter, self).__init__()
+
+    self.source = None
+    self.spans = None
+
+  def add_span(self, source, start, end):
+    """ Adds the line source[start:end]. Every span in a filter must refer to the
+    same source
+    """
+
+    if self.spans is None:
+      self.source = source
+      self.spans = array("l")
+
+    self.spans.append(start)
+    self.spans.append(end)
+
+    if self._memo is not False:
+      self._changed()
+
+    return self
+
+  def _copy(self):
+    copy = super(Filter, self)._copy()
+
+    if copy.spans is not None:
+      copy.spans = array("l", copy.spans)
+
+    return copy
+
+  def set_body(self, text):
+    """ Replaces all of the lines in the filter with `text`
+    """
+
+    self.children = []
+    self.last_child = None
+    self.source = None
+    self.spans = None
+
+    return self.add_child(Text(text))
+
   def _parse_children(self):
     return False
 
-  def _render_children(self):
-    text = ""
+  def _iter_parts(self):
+    # The children are lines of text, there's nothing to gain from walking them
+    return Element._iter_parts(self)
 
-    for i in range(len(self.children)):
-      text += self.children[i].render()
+  def _iter_lines(self):
+    for e in self.children:
+      yield e.render()
 
-      if i != len(self.children) - 1:
-        text += "\n"
+    if self.spans:
+      source = self.source
+      spans = self.spans
 
-    # Strip any trailing newlines
-    return text.rstrip("\n")
+      for i in range(0, len(spans), 2):
+        yield source[spans[i]:spans[i + 1]]
+
+  def _render_children_to(self, write):
+    """ Writes the lines separated by newlines. Trailing newlines are left off, so
+    newlines are only written once there's some text after them.
+    """
+
+    newlines = -1
+
+    for line in self._iter_lines():
+      newlines += 1
+      text = line.rstrip("\n")
+
+      if text:
+        if newlines:
+          write("\n" * newlines)
+
+        write(text)
+        newlines = 0
+
+      newlines += len(line) - len(text)
 
 class Comment(Filter):
   """ HTML comment block
   """
 
+  __slots__ = ()
+
   def __init__(self, render=True):
     super(Comment, self).__init__()
 
@@ -164,6 +505,8 @@ class ConditionalComment(Node):
   if a user is using IE and, if so, what version
   """
 
+  __slots__ = ("condition",)
+
   def __init__(self, condition):
     super(ConditionalComment, self).__init__()
 
@@ -176,9 +519,11 @@ class ConditionalComment(Node):
     return "<![endif]-->"
 
 class FilterPlain(Filter):
-  pass
+  __slots__ = ()
 
 class FilterJavascript(Filter):
+  __slots__ = ()
+
   def _pre_render(self):
     return '<script type="text/javascript">'
 
@@ -186,13 +531,33 @@ class FilterJavascript(Filter):
     return '</script>'
 
 class FilterCSS(Filter):
+  __slots__ = ()
+
   def _pre_render(self):
     return '<style type="text/css">'
 
   def _post_render(self):
     return '</style>'
 
+class FilterCompiled(Filter):
+  """ A filter that was registered by the application (see parsers/filter.py). Its
+  body is passed to `func` once the filter is closed, and the html that's returned
+  takes its place
+  """
+
+  __slots__ = ("name", "func")
+
+  def __init__(self, name=None, func=None):
+    super(FilterCompiled, self).__init__()
+
+    self.name = name
+    self.func = func
+
 class BaseBlock(object):
+  # The slots are declared by the concrete classes, a mixin with slots can't be
+  # combined with Node or Element
+  __slots__ = ()
+
   def __init__(self):
     super(BaseBlock, self).__init__()
 
@@ -207,6 +572,8 @@ class Block(BaseBlock, Node):
   {% endfor %}
   """
 
+  __slots__ = ("name", "args", "linked_to", "render_end_tag", "tags")
+
   def __init__(self):
     super(Block, self).__init__()
 
@@ -241,8 +608,7 @@ class InlineBlock(BaseBlock, Element):
   ...
   """
 
-  def __init__(self):
-    super(InlineBlock, self).__init__()
+  __slots__ = ("name", "args")
 
   def render(self):
     text = "{%% %s" % self.name
@@ -259,15 +625,95 @@ class BaseTag(object):
   # What to use for the end of the tag (not to be confused with the closing tag, </tag>)
   END_OF_TAG = ">"
 
+  # See BaseBlock
+  __slots__ = ()
+
   def __init__(self):
     super(BaseTag, self).__init__()
-    
-    self.attrs = OrderedDict()
-    self.classes = []
+
+    # Most tags don't have attributes or classes, so these are only allocated when
+    # they are needed (see add_class)
+    self.attrs = None
+    self.classes = ()
     self.id = None
     self.tag = ""
 
+    # The rendered opening and closing tags, set by freeze
+    self.opening = None
+    self.closing = None
+
+  def _copy(self):
+    copy = super(BaseTag, self)._copy()
+
+    if copy.classes:
+      copy.classes = list(copy.classes)
+
+    if copy.attrs:
+      copy.attrs = OrderedDict(copy.attrs)
+
+    return copy
+
+  def add_class(self, name):
+    if self.classes:
+      self.classes.append(name)
+    else:
+      self.classes = [name]
+
+    self._head_changed()
+
+  def set_id(self, id):
+    self.id = id
+    self._head_changed()
+
+  def set_attribute(self, name, value=None, quote_char="\""):
+    """ Adds or replaces an attribute. A value of None adds the attribute without a value
+    (e.g. `required`)
+    """
+
+    attr = Attribute()
+    attr.name = name
+    attr.value = value
+    attr.quote_char = quote_char
+
+    if self.attrs is None:
+      self.attrs = OrderedDict()
+
+    self.attrs[name] = attr
+    self._head_changed()
+
+  def remove_attribute(self, name):
+    if self.attrs:
+      self.attrs.pop(name, None)
+
+    self._head_changed()
+
+  def _head_changed(self):
+    """ Unfreezes the tag after its id, classes or attributes changed
+    """
+
+    self.opening = None
+    self._changed()
+
+  def freeze(self):
+    """ Checks the tag and renders its opening and closing tags ahead of time, so that
+    rendering only has to return them. The parser freezes every tag once its attributes
+    have been parsed. Changing the tag afterwards through add_class, set_id, etc.
+    unfreezes it, but changing the fields directly means freeze has to be called again.
+    """
+
+    self.opening = self._render_opening()
+    self.closing = "</%s>" % self.tag
+
   def _pre_render(self):
+    if self.opening is not None:
+      return self.opening
+
+    return self._render_opening()
+
+  def _render_opening(self):
+    if self.id and self.attrs and "id" in self.attrs:
+      raise ParseError("Tag has both an #id and an id='', not sure which to use")
+
     text = "<%s" % self.tag
 
     if self.id:
@@ -278,12 +724,12 @@ class BaseTag(object):
     if classes:
       text += " class=\"%s\"" % classes
     
+    if not self.attrs:
+      return text + self.END_OF_TAG
+
     # Add the attributes
     for k, v in self.attrs.items():
-      # Skip if the ID was already defined
-      if k == "id" and self.id:
-        raise ParseError("Tag has both an #id and an id='', not sure which to use")
-      elif k == "class":
+      if k == "class":
         # Classes are inserted manually, above
         continue
 
@@ -298,7 +744,7 @@ class BaseTag(object):
     dictionary, and returns it as a string
     """
 
-    classes = self.attrs.get("class", None)
+    classes = self.attrs.get("class", None) if self.attrs else None
 
     # No classes were set in the attributes
     if not classes:
@@ -320,10 +766,12 @@ class Tag(BaseTag, Node):
   <tag>...</tag>
   """
 
-  def __init__(self):
-    super(Tag, self).__init__()
+  __slots__ = ("attrs", "classes", "id", "tag", "opening", "closing")
 
   def _post_render(self):
+    if self.opening is not None:
+      return self.closing
+
     return "</%s>" % self.tag
 
 class SelfClosingTag(BaseTag, Element):
@@ -332,8 +780,7 @@ class SelfClosingTag(BaseTag, Element):
   <tag />
   """
 
-  def __init__(self):
-    super(SelfClosingTag, self).__init__()
+  __slots__ = ("attrs", "classes", "id", "tag", "opening", "closing")
 
   END_OF_TAG = " />"
 
@@ -0,0 +1,215 @@
+from array import array
+
+from hamplify.element import *
+
+# What kind of element each node in a FlatTree was made from
+KIND_ROOT = 0
+KIND_TEXT = 1
+KIND_VARIABLE = 2
+KIND_TAG = 3
+KIND_SELF_CLOSING_TAG = 4
+KIND_BLOCK = 5
+KIND_INLINE_BLOCK = 6
+KIND_COMMENT = 7
+KIND_FILTER = 8
+KIND_OTHER = 9
+
+# Subclasses come before their base classes
+ELEMENT_KINDS = (
+  (RootNode, KIND_ROOT),
+  (Variable, KIND_VARIABLE),
+  (Text, KIND_TEXT),
+  (Tag, KIND_TAG),
+  (SelfClosingTag, KIND_SELF_CLOSING_TAG),
+  (Block, KIND_BLOCK),
+  (InlineBlock, KIND_INLINE_BLOCK),
+  (Comment, KIND_COMMENT),
+  (Filter, KIND_FILTER),
+)
+
+def get_kind(e):
+  for cls, kind in ELEMENT_KINDS:
+    if isinstance(e, cls):
+      return kind
+
+  return KIND_OTHER
+
+class FlatTree(object):
+  """ A compact, read only tree made of parallel arrays instead of element objects.
+  Node i is described by:
+
+  kinds[i]:        The KIND_ of element it was made from
+  parents[i]:      Index of its parent (-1 for the root, which is always node 0)
+  first_child[i]:  Index of its first child, or -1
+  next_sibling[i]: Index of its next sibling, or -1
+  pre[i]:          Index into `strings` of the text before its children
+  post[i]:         Index into `strings` of the text after its children
+
+  Nodes are stored in document order, so every node comes after its parent and
+  before its next sibling. Elements that don't have their children parsed or rendered
+  (filters, comments that aren't rendered) are stored whole as a single node.
+
+  A FlatTree is a handful of arrays and a list of strings, so it pickles quickly
+  and takes up little memory.
+  """
+
+  def __init__(self):
+    self.kinds = array("b")
+    self.parents = array("l")
+    self.first_child = array("l")
+    self.next_sibling = array("l")
+    self.pre = array("l")
+    self.post = array("l")
+    self.strings = []
+
+  def __len__(self):
+    return len(self.kinds)
+
+  @classmethod
+  def from_element(cls, root):
+    """ Converts an element tree into a FlatTree
+    """
+
+    builder = FlatTreeBuilder(root)
+    stack = [iter(root.children)]
+
+    while stack:
+      for e in stack[-1]:
+        if is_expanded(e):
+          builder.open(e)
+          stack.append(iter(e.children))
+          break
+
+        builder.add(e)
+      else:
+        stack.pop()
+
+        if stack:
+          builder.close(builder.elements[-1])
+
+    return builder.finish()
+
+  def iter_children(self, i):
+    """ Yields the indices of the children of node i
+    """
+
+    child = self.first_child[i]
+
+    while child != -1:
+      yield child
+      child = self.next_sibling[child]
+
+  def render(self):
+    buffer = []
+    self.render_to(buffer.append)
+
+    return "".join(buffer)
+
+  def render_to(self, write):
+    """ Renders the tree by going through the nodes in order. Every node that isn't a
+    parent of the next node has been fully written, and needs to be closed
+    """
+
+    strings = self.strings
+    parents = self.parents
+    post = self.post
+    stack = []
+
+    for i, pre in enumerate(self.pre):
+      parent = parents[i]
+
+      while stack and stack[-1] != parent:
+        write(strings[post[stack.pop()]])
+
+      write(strings[pre])
+      stack.append(i)
+
+    while stack:
+      write(strings[post[stack.pop()]])
+
+def is_expanded(e):
+  """ Whether an element's children are stored as separate nodes
+  """
+
+  return isinstance(e, Node) and e._parse_children() and e.render_children
+
+class FlatTreeBuilder(object):
+  """ Builds a FlatTree one element at a time. This is also a sink for the parser (see
+  Parser.parse_flat), which opens nodes as they are pushed, closes them once every
+  one of their children has been added, and adds everything else whole.
+  """
+
+  def __init__(self, root):
+    self.tree = FlatTree()
+
+    # Index of each string in tree.strings, so each distinct string is only kept once
+    self.string_index = {}
+
+    # The open nodes, and the last child added to each
+    self.stack = []
+    self.last_child = []
+
+    # The open elements, so that from_element knows what to close
+    self.elements = []
+
+    self.open(root)
+
+  def open(self, e):
+    i = self._add(e, self._string(e._pre_render()))
+    self.stack.append(i)
+    self.last_child.append(-1)
+    self.elements.append(e)
+
+  def close(self, e):
+    self.tree.post[self.stack.pop()] = self._string(e._post_render())
+    self.last_child.pop()
+    self.elements.pop()
+
+  def add(self, e):
+    buffer = []
+    e.render_to(buffer.append)
+    self._add(e, self._string("".join(buffer)))
+
+  def finish(self):
+    """ Closes the root and returns the tree
+    """
+
+    while self.stack:
+      self.close(self.elements[-1])
+
+    return self.tree
+
+  def _add(self, e, pre):
+    tree = self.tree
+    i = len(tree.kinds)
+
+    if self.stack:
+      parent = self.stack[-1]
+      previous = self.last_child[-1]
+
+      if previous == -1:
+        tree.first_child[parent] = i
+      else:
+        tree.next_sibling[previous] = i
+
+      self.last_child[-1] = i
+    else:
+      parent = -1
+
+    tree.kinds.append(get_kind(e))
+    tree.parents.append(parent)
+    tree.first_child.append(-1)
+    tree.next_sibling.append(-1)
+    tree.pre.append(pre)
+    tree.post.append(self._string(""))
+
+    return i
+
+  def _string(self, text):
+    index = self.string_index.get(text)
+
+    if index is None:
+      index = self.string_index[text] = len(self.tree.strings)
+      self.tree.strings.append(text)
+
+    return index
@@ -0,0 +1,169 @@
+import sys
+
+from hamplify.element import *
+
+def _tag_key(e, children):
+  attrs = ()
+
+  if e.attrs:
+    attrs = tuple((a.name, a.value, a.quote_char) for a in e.attrs.values())
+
+  return (type(e), e.tag, e.id, tuple(e.classes), attrs, children)
+
+def _text_key(e, children):
+  return (type(e), e.text)
+
+def _block_key(e, children):
+  return (type(e), e.name, e.args, e.render_end_tag, e.tags, children)
+
+def _inline_block_key(e, children):
+  return (type(e), e.name, e.args)
+
+def _filter_key(e, children):
+  # Filters keep their lines as offsets into the source, so they're compared by text
+  return (type(e), e.render_children, e._render_children())
+
+def _compiled_filter_key(e, children):
+  return (type(e), e.func, e._render_children())
+
+def _conditional_comment_key(e, children):
+  return (type(e), e.condition, children)
+
+# How to build the key for each type of element. Elements of any other type (including
+# subclasses, which could have anything in them) are never shared
+KEYS = {
+  Text: _text_key,
+  Variable: _text_key,
+  Tag: _tag_key,
+  SelfClosingTag: _tag_key,
+  Block: _block_key,
+  InlineBlock: _inline_block_key,
+  Comment: _filter_key,
+  FilterPlain: _filter_key,
+  FilterJavascript: _filter_key,
+  FilterCSS: _filter_key,
+  FilterCompiled: _compiled_filter_key,
+  ConditionalComment: _conditional_comment_key,
+}
+
+class SubtreeInterner(object):
+  """ Makes identical subtrees share a single instance, within a tree and across every
+  tree passed to the same interner. Two subtrees are identical if they have the same
+  types, names, text and attributes all the way down.
+
+  A shared subtree belongs to more than one parent, so its `parent`, depth and line
+  spans are only right for the first tree it was found in. Interned trees should be
+  treated as read only: they can be rendered (and flattened, folded, etc.) but not
+  changed or reparsed.
+
+  The interner holds on to every subtree it has seen, so it should live as long as the
+  trees do.
+  """
+
+  def __init__(self):
+    # Maps the key of each subtree to the instance that's shared. A node's key has the
+    # ids of its (already interned) children, so it doesn't need the whole subtree in it
+    self.table = {}
+
+    self.nodes = 0
+    self.shared = 0
+    self.freed = 0
+    self.bytes_saved = 0
+
+  def intern(self, root):
+    """ Replaces every subtree of `root` that has been seen before with the shared
+    instance, and returns the root
+    """
+
+    # Nodes which can't be shared, since something under them can't be
+    unshared = set()
+
+    # Walk the tree depth first, visiting each node after its children
+    stack = [(root, False)]
+
+    while stack:
+      node, visited = stack.pop()
+
+      if not visited:
+        stack.append((node, True))
+        stack.extend((e, False) for e in node.children if isinstance(e, Node))
+        continue
+
+      children = node.children
+
+      for i, child in enumerate(children):
+        shared = self._intern_child(child, unshared)
+
+        if shared is None:
+          unshared.add(node)
+        elif shared is not child:
+          children[i] = shared
+
+          if node.last_child is child:
+            node.last_child = shared
+
+    return root
+
+  def report(self):
+    """ Returns a summary of how much has been shared so far
+    """
+
+    return ("%d elements interned, %d subtrees shared, %d elements freed, ~%d KB saved"
+      % (self.nodes, self.shared, self.freed, self.bytes_saved // 1024))
+
+  def _intern_child(self, e, unshared):
+    """ Returns the shared instance of `e`, or None if it can't be shared
+    """
+
+    self.nodes += 1
+
+    if e in unshared:
+      return None
+
+    get_key = KEYS.get(type(e))
+
+    if get_key is None:
+      return None
+
+    children = None
+
+    if isinstance(e, Node):
+      children = tuple(id(c) for c in e.children)
+
+    key = get_key(e, children)
+    shared = self.table.get(key)
+
+    if shared is None:
+      self.table[key] = e
+      return e
+
+    if shared is not e:
+      self.shared += 1
+      self._count_freed(e, shared)
+
+    return shared
+
+  def _count_freed(self, e, shared):
+    """ Adds up the memory used by `e`, which is about to be replaced by `shared`. Its
+    children have already been replaced and counted, so it's the only element freed
+    """
+
+    size = sys.getsizeof(e)
+
+    if isinstance(e, BaseTag):
+      if e.attrs:
+        size += sys.getsizeof(e.attrs)
+
+      if e.classes:
+        size += sys.getsizeof(e.classes)
+
+    if isinstance(e, Filter) and e.spans:
+      size += sys.getsizeof(e.spans)
+
+    if isinstance(e, Node):
+      size += sys.getsizeof(e.children)
+    elif isinstance(e, Text) and e.text is not shared.text:
+      size += sys.getsizeof(e.text)
+
+    self.freed += 1
+    self.bytes_saved += size
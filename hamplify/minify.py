@@ -0,0 +1,302 @@
+import re
+
+# Elements whose contents are left exactly as they are
+RAW_TAGS = ("pre", "script", "style", "textarea")
+
+# Engine tags ({% %}, {{ }}, {# #}) could have anything in them, so they're never changed
+ENGINE_TAG = r"\{%.*?%\}|\{\{.*?\}\}|\{\#.*?\#\}"
+
+# Whitespace as html sees it. \s also matches characters like non-breaking spaces, which
+# show up on the page
+HTML_SPACE = r"[ \t\n\r\f]"
+HTML_SPACE_CHARS = " \t\n\r\f"
+
+# Comments, engine tags, tags and quoted values that aren't closed run to the end of the
+# html. That way every `<` that starts a tag matches exactly one way; otherwise an
+# unclosed one would be retried at each place the pattern could backtrack to, and then
+# again from every `<` after it
+UNCLOSED_ENGINE_TAG = r"\{%.*?(?:%\}|\Z)|\{\{.*?(?:\}\}|\Z)|\{\#.*?(?:\#\}|\Z)"
+
+regex_token = re.compile(r"""
+  (?P<comment><!--.*?(?:-->|\Z))
+  |(?P<engine>""" + UNCLOSED_ENGINE_TAG + r""")
+  |(?P<tag><(?P<closing>/?)(?P<name>[a-zA-Z!][^ \t\n\r\f/>]*)
+    (?:"[^"]*(?:"|\Z)|'[^']*(?:'|\Z)|""" + UNCLOSED_ENGINE_TAG + r"""|\{(?![{%\#])|[^>"'{])*
+    (?:(?P<end>>)|\Z))
+  |(?P<ws>""" + HTML_SPACE + r"""+)
+""", re.S | re.X)
+
+# The parts of a tag that can be minified: whitespace, and quoted attribute values
+regex_tag_part = re.compile(r"""
+  (?P<engine>""" + ENGINE_TAG + r""")
+  |=""" + HTML_SPACE + r"""*(?P<value>"[^"]*"|'[^']*')(?P<slash>/?)
+  |(?P<ws>""" + HTML_SPACE + r"""+)
+""", re.S | re.X)
+
+# Attribute values that don't need to be quoted
+regex_unquoted_value = re.compile(r"^[a-zA-Z0-9_.:-]+$")
+
+regex_raw_closing = dict((name, re.compile(r"</%s[ \t\n\r\f>]" % name, re.I)) for name in RAW_TAGS)
+
+def minify_html(html):
+  """ Minifies rendered html. Runs of whitespace are collapsed into a single space,
+  both in text and inside of tags, and quotes are dropped from attribute values that
+  don't need them. Comments, engine tags, and the contents of <pre>, <textarea>,
+  <script> and <style> are left alone.
+
+  Whitespace is collapsed rather than removed, since a single space between two inline
+  elements can still show up on the page. Everything after a comment, engine tag or tag
+  that isn't closed is left as it is.
+  """
+
+  out = []
+  pos = 0
+  length = len(html)
+
+  while pos < length:
+    match = regex_token.search(html, pos)
+
+    if match is None:
+      out.append(html[pos:])
+      break
+
+    out.append(html[pos:match.start()])
+    pos = match.end()
+
+    if match.group("ws") is not None:
+      out.append(" ")
+    elif match.group("tag") is not None and match.group("end") is not None:
+      out.append(regex_tag_part.sub(_minify_tag_part, match.group()))
+
+      name = match.group("name").lower()
+
+      if not match.group("closing") and name in RAW_TAGS:
+        # Copy everything up to the closing tag as it is
+        closing = regex_raw_closing[name].search(html, pos)
+        end = closing.start() if closing else length
+        out.append(html[pos:end])
+        pos = end
+    else:
+      out.append(match.group())
+
+  return "".join(out)
+
+def _minify_tag_part(match):
+  if match.group("engine") is not None:
+    return match.group()
+  elif match.group("value") is not None:
+    value = match.group("value")
+    slash = match.group("slash")
+    after = match.string[match.end():match.end() + 1]
+
+    # A slash right after an unquoted value would become part of it, and so would
+    # anything else that isn't whitespace
+    if not slash and after in HTML_SPACE_CHARS + ">" and regex_unquoted_value.match(value[1:-1]):
+      value = value[1:-1]
+
+    return "=" + value + slash
+  else:
+    return " "
+
+regex_css_token = re.compile(r"""
+  (?P<ws>\s+)
+  |(?P<comment>/\*.*?(?:\*/|$))
+  |(?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+  |(?P<other>[^\s"'/]+|/)
+""", re.S | re.X)
+
+# Spaces can be dropped after these characters, and before the ones after them
+CSS_NO_SPACE_AFTER = "{};,>(:"
+CSS_NO_SPACE_BEFORE = "{};,>)!"
+
+def minify_css(css):
+  """ Minifies a stylesheet by removing comments and whitespace. Whitespace is only
+  dropped next to characters where it can't change anything, e.g. a space before a
+  colon is kept since `a :hover` and `a:hover` are different selectors. Strings are
+  left alone.
+  """
+
+  out = []
+  space = False
+
+  for match in regex_css_token.finditer(css):
+    kind = match.lastgroup
+
+    if kind == "ws" or kind == "comment":
+      space = True
+      continue
+
+    token = match.group()
+
+    if space and out and out[-1][-1] not in CSS_NO_SPACE_AFTER and token[0] not in CSS_NO_SPACE_BEFORE:
+      out.append(" ")
+
+    space = False
+
+    # The last semicolon in a block isn't needed
+    if token[0] == "}" and out and out[-1] == ";":
+      out.pop()
+
+    if kind == "other":
+      # Split on semicolons so that they can be checked for above
+      out.extend(part for part in re.split(r"(;)", token) if part)
+    else:
+      out.append(token)
+
+  return "".join(out)
+
+class _Unminifiable(Exception):
+  """ Raised when a script has something in it that minify_js can't deal with safely
+  """
+
+regex_js_token = re.compile(r"""
+  (?P<ws>[^\S\n]+)
+  |(?P<newline>\n\s*)
+  |(?P<line_comment>//[^\n]*)
+  |(?P<block_comment>/\*.*?\*/)
+  |(?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  |(?P<template>`(?:[^`\\$]|\\.|\$(?!\{))*`)
+  |(?P<number>0[xXoObB][0-9a-fA-F_]+n?|(?:\d[\d_]*\.?[\d_]*|\.\d[\d_]*)(?:[eE][+-]?\d+)?n?)
+  |(?P<word>[\w$\\]+|[^\x00-\x7f]+)
+  |(?P<punct>>>>=?|\.\.\.|===|!==|\*\*=?|<<=|>>=?|<<|=>|\?\?=?|\?\.|\+\+|--|&&=?|\|\|=?|[-+*/%&|^<>!=]=|[^\s\w$\\])
+""", re.S | re.X)
+
+regex_js_regex = re.compile(r"/(?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/[a-zA-Z]*")
+
+# Words after which a / starts a regex rather than a division
+JS_REGEX_KEYWORDS = frozenset(("return", "typeof", "instanceof", "in", "of", "new", "delete",
+  "void", "throw", "case", "do", "else", "yield", "await"))
+
+# Words whose parentheses are followed by a statement, which can start with a regex
+JS_HEADER_KEYWORDS = frozenset(("if", "while", "for", "with"))
+
+# A newline after these words ends the statement
+JS_RESTRICTED_WORDS = frozenset(("return", "break", "continue", "throw", "yield", "async"))
+
+# A newline before a token starting with one of these can't end a statement, since none
+# of them can start one
+JS_CONTINUATION_CHARS = ")]},;.?:=*%&|^<>"
+
+def minify_js(js):
+  """ Minifies a script by removing comments and whitespace. Newlines are only removed
+  where a semicolon couldn't be inserted in their place, so it's safe for scripts that
+  leave semicolons out. Scripts that can't be read safely (e.g. template strings with
+  ${} in them) are returned with only the surrounding whitespace removed.
+  """
+
+  try:
+    return _minify_js(js)
+  except _Unminifiable:
+    return js.strip()
+
+def _minify_js(js):
+  out = []
+  prev = None
+  prev_kind = None
+  space = newline = False
+  pos = 0
+
+  # Whether each open parenthesis belongs to an if/while/for/with, and whether the
+  # last one that was closed did
+  headers = []
+  header = False
+  length = len(js)
+
+  while pos < length:
+    match = regex_js_token.match(js, pos)
+
+    if match is None:
+      raise _Unminifiable()
+
+    kind = match.lastgroup
+    token = match.group()
+
+    if kind in ("ws", "line_comment"):
+      space = True
+      pos = match.end()
+      continue
+    elif kind == "newline":
+      newline = True
+      pos = match.end()
+      continue
+    elif kind == "block_comment":
+      # A comment with a newline in it counts as a newline
+      if "\n" in token:
+        newline = True
+      else:
+        space = True
+
+      pos = match.end()
+      continue
+
+    if token == "/" or token == "/=":
+      regex = regex_js_regex.match(js, pos)
+
+      if prev == "}" and regex is not None:
+        # A block ends the same way an object does, and only a regex can follow a block
+        raise _Unminifiable()
+
+      if prev == ")" and header or _starts_regex(prev, prev_kind):
+        if regex is None:
+          raise _Unminifiable()
+
+        match = regex
+        kind = "regex"
+        token = match.group()
+    elif token == "(":
+      headers.append(prev in JS_HEADER_KEYWORDS)
+    elif token == ")":
+      header = headers.pop() if headers else False
+    elif token == "`":
+      # An unterminated template or one with ${} in it
+      raise _Unminifiable()
+
+    if prev is not None and (space or newline):
+      out.append(_js_separator(prev, prev_kind, token, kind, newline))
+
+    out.append(token)
+    prev = token
+    prev_kind = kind
+    space = newline = False
+    pos = match.end()
+
+  return "".join(out)
+
+def _starts_regex(prev, prev_kind):
+  if prev is None:
+    return True
+
+  if prev_kind == "word":
+    return prev in JS_REGEX_KEYWORDS
+
+  return prev_kind == "punct" and prev not in (")", "]", "}")
+
+def _js_separator(prev, prev_kind, token, kind, newline):
+  """ Returns what has to go between two tokens that had whitespace between them
+  """
+
+  if newline:
+    ends_statement = (
+      prev_kind != "punct" or prev in (")", "]", "}", "++", "--")
+    ) and token[0] not in JS_CONTINUATION_CHARS
+
+    if ends_statement or prev in JS_RESTRICTED_WORDS:
+      return "\n"
+
+  first = token[0]
+  last = prev[-1]
+
+  if _is_word_char(last) and _is_word_char(first):
+    return " "
+
+  # Keep these from running together into a different token
+  if (last + first) in ("++", "--", "//", "/*", "<!") or (prev_kind == "number" and first == "."):
+    return " "
+
+  if prev_kind == "regex" and _is_word_char(first):
+    return " "
+
+  return ""
+
+def _is_word_char(c):
+  return c.isalnum() or c in "_$\\" or ord(c) > 127
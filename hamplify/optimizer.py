@@ -0,0 +1,85 @@
+from hamplify.element import Block, InlineBlock, Node, Text, Variable, is_significant
+
+# Elements whose output depends on the template engine. Anything else renders the
+# same every time
+DYNAMIC_ELEMENTS = (Block, InlineBlock, Variable)
+
+def fold_static(root):
+  """ Replaces every subtree that has no blocks or variables in it with a single Text
+  element holding its rendered html. Adjacent static siblings are merged into one Text,
+  so rendering the tree only has to visit the dynamic parts of it. The html the tree
+  renders is unchanged.
+
+  The tree is modified in place, and returned.
+  """
+
+  # The nodes that have a dynamic element in them (or are dynamic themselves)
+  dynamic = set()
+
+  # Walk the tree depth first, visiting each node after its children
+  stack = [(root, False)]
+
+  while stack:
+    node, visited = stack.pop()
+
+    if not visited:
+      stack.append((node, True))
+
+      for child in node.children:
+        if isinstance(child, Node):
+          stack.append((child, False))
+        elif isinstance(child, DYNAMIC_ELEMENTS):
+          dynamic.add(child)
+
+      continue
+
+    if isinstance(node, DYNAMIC_ELEMENTS) or any(child in dynamic for child in node.children):
+      dynamic.add(node)
+      _fold_children(node, dynamic)
+
+  # The root can't be replaced, so if the whole tree is static just its children are
+  if root not in dynamic:
+    _fold_children(root, dynamic)
+
+  return root
+
+def _fold_children(node, dynamic):
+  """ Merges each run of static children into a single Text element
+  """
+
+  children = []
+  run = []
+
+  for child in node.children:
+    if child in dynamic:
+      _fold_run(node, run, children)
+      children.append(child)
+      run = []
+    else:
+      run.append(child)
+
+  _fold_run(node, run, children)
+
+  node.children = children
+  node.last_child = None
+
+  for child in reversed(children):
+    if is_significant(child):
+      node.last_child = child
+      break
+
+def _fold_run(node, run, children):
+  if not run:
+    return
+
+  # Already as small as it can get
+  if len(run) == 1 and type(run[0]) is Text:
+    children.append(run[0])
+    return
+
+  text = Text("".join("".join(e.iter_render()) for e in run))
+  text.set_parent(node)
+  text.line_start = run[0].line_start
+  text.line_end = run[-1].line_end
+
+  children.append(text)
@@ -0,0 +1,123 @@
+from array import array
+from collections import deque
+from operator import attrgetter
+
+from hamplify.element import *
+from hamplify.element import _get_slot_names
+
+# Slots that point at another element. They're stored as indices into the packed
+# elements (-1 for None), and children lists are rebuilt from the parents
+REFERENCE_SLOTS = ("parent", "last_child", "linked_to")
+
+class PackedElements(object):
+  """ A list of element trees stored column by column, so they can be sent to another
+  process quickly. Pickling elements one at a time costs about as much as parsing them
+  did, since every slot of every element is written and read back on its own.
+
+  Elements are numbered in document order. For element i:
+
+  kinds[i]:   Index into `classes` of its type
+  parents[i]: Index of its parent, or -1 for the elements at the top
+
+  `columns` maps each index in `classes` to a dict of slot names to the values of that
+  slot, for every element of that type in order. Slots that point at other elements
+  hold indices instead.
+  """
+
+  def __init__(self):
+    self.classes = []
+    self.kinds = array("l")
+    self.parents = array("l")
+    self.columns = {}
+
+  def __len__(self):
+    return len(self.kinds)
+
+  @classmethod
+  def pack(cls, elements):
+    """ Packs a list of elements and everything under them. References to elements
+    outside of the list (e.g. the parent of the top elements) are dropped
+    """
+
+    packed = cls()
+    class_index = {}
+    index = {}
+    ordered = []
+
+    # Number the elements in document order
+    stack = [(e, -1) for e in reversed(elements)]
+
+    while stack:
+      e, parent = stack.pop()
+      kind = class_index.get(type(e))
+
+      if kind is None:
+        kind = class_index[type(e)] = len(packed.classes)
+        packed.classes.append(type(e))
+
+      index[id(e)] = len(ordered)
+      ordered.append(e)
+      packed.kinds.append(kind)
+      packed.parents.append(parent)
+
+      if isinstance(e, Node):
+        i = index[id(e)]
+        stack.extend((child, i) for child in reversed(e.children))
+
+    for kind, members in enumerate(_group(ordered, packed.kinds, len(packed.classes))):
+      columns = packed.columns[kind] = {}
+
+      for name in _get_slot_names(packed.classes[kind]):
+        if name == "children":
+          continue
+
+        values = list(map(attrgetter(name), members))
+
+        if name in REFERENCE_SLOTS:
+          values = array("l", [index.get(id(v), -1) for v in values])
+
+        columns[name] = values
+
+    return packed
+
+  def unpack(self):
+    """ Rebuilds the elements, and returns the ones at the top
+    """
+
+    new = object.__new__
+    classes = self.classes
+    elements = [new(classes[kind]) for kind in self.kinds]
+
+    for kind, members in enumerate(_group(elements, self.kinds, len(classes))):
+      cls = classes[kind]
+
+      for name, values in self.columns[kind].items():
+        if name in REFERENCE_SLOTS:
+          values = [elements[i] if i != -1 else None for i in values]
+
+        deque(map(getattr(cls, name).__set__, members, values), 0)
+
+      if issubclass(cls, Node):
+        for e in members:
+          e.children = []
+
+    top = []
+
+    for e, parent in zip(elements, self.parents):
+      if parent == -1:
+        top.append(e)
+      else:
+        elements[parent].children.append(e)
+
+    return top
+
+def _group(elements, kinds, count):
+  """ Splits the elements into a list for each kind, keeping them in order
+  """
+
+  groups = [[] for i in range(count)]
+
+  for e, kind in zip(elements, kinds):
+    groups[kind].append(e)
+
+  return groups
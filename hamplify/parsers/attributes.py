@@ -1,14 +1,19 @@
+import re
+
 from collections import OrderedDict
 
 from .base import BaseParser
 from hamplify.config import *
 
-class Attribute():
-  name = None
-  value = None
+class Attribute(object):
+  __slots__ = ("name", "value", "quote_char")
+
+  def __init__(self):
+    self.name = None
+    self.value = None
 
-  # The quote character that wraps the attributes (single/double)
-  quote_char = ""
+    # The quote character that wraps the attributes (single/double)
+    self.quote_char = ""
 
   def __eq__(self, other):
     """ Required for unit tests to be able to compare this to a regular dict
@@ -28,32 +33,18 @@ class Attribute():
     else:
       return "%s=%s%s%s" % (self.name, self.quote_char, self.value, self.quote_char)
 
+regex_name = re.compile(r"[a-zA-Z-]+")
+regex_int = re.compile(r"[0-9]+")
+regex_spaces = re.compile(r" *")
+
 class AttributeParser(BaseParser):
-  """ State-based parser for extracting attributes from a tag.
+  """ Regex parser for extracting attributes from a tag. Names, numbers, quoted values
+  and runs of spaces are each read in a single step.
   """
 
-  STATE_DONE = 0
-  STATE_PRE_NAME_WS = 1
-  STATE_ATTR_NAME = 2
-  STATE_POST_NAME_WS = 3
-  STATE_PRE_VALUE_WS = 4
-  STATE_VALUE = 5
-
   def __init__(self, options=None):
     super(AttributeParser, self).__init__(options)
 
-    self._reset()
-
-  def _reset(self):
-    self.attrs = OrderedDict()
-    self.cur_attr = Attribute()
-    self.buffer = ""
-    self.char = None
-    self.pos = 0
-    self.state = self.STATE_PRE_NAME_WS
-    self.value_type = str
-    self.quote_char = None
-
   def parse(self, text):
     """ Parses an attribute string, returning a 2-tuple of the attributes as a dictionary,
     and whatever text was remaining after the attributes.
@@ -63,164 +54,117 @@ class AttributeParser(BaseParser):
     returns ({"type": "text", "required": None}, "")
     """
 
-    # Reset the parser state
-    self._reset()
+    attrs, pos = self.parse_at(text)
+
+    return (attrs, text[pos:])
 
-    self.length = len(text)
-    self.char = text[self.pos]
+  def parse_at(self, text, pos=0):
+    """ Parses the attributes that start at text[pos], returning a 2-tuple of the
+    attributes and the position right after them
+    """
 
     # This parser expects to the string to start right at the attributes
-    if self.char != TOKEN_ATTR_WRAPPER[0]:
-      raise ParseError("Expected a space or '%s', but found '%s' instead." % (TOKEN_ATTR_WRAPPER[0], self.char))
+    if text[pos] != TOKEN_ATTR_WRAPPER[0]:
+      raise ParseError("Expected a space or '%s', but found '%s' instead." % (TOKEN_ATTR_WRAPPER[0], text[pos]))
 
-    self.pos += 1
+    attrs = OrderedDict()
+    end = TOKEN_ATTR_WRAPPER[1]
+    length = len(text)
+    pos += 1
 
-    # Iterate through each character, changing states as we progress
-    while self.state != self.STATE_DONE and self.pos < self.length:
-      self.char = text[self.pos]
+    while True:
+      pos = regex_spaces.match(text, pos).end()
 
-      if self.state == self.STATE_PRE_NAME_WS:
-        self._parse_pre_name_whitespace()
-      elif self.state == self.STATE_ATTR_NAME:
-        self._parse_attr_name()
-      elif self.state == self.STATE_POST_NAME_WS:
-        self._parse_post_name_whitespace()
-      elif self.state == self.STATE_PRE_VALUE_WS:
-        self._parse_pre_value_whitespace()
-      elif self.state == self.STATE_VALUE:
-        self._parse_value()
+      if pos == length:
+        break
 
-      self.pos += 1
+      if text[pos] == end:
+        return (attrs, pos + 1)
 
-    if self.state != self.STATE_DONE:
-      raise ParseError("Reached EOL while parsing attributes")
+      # Attribute name
+      match = regex_name.match(text, pos)
 
-    return (self.attrs, text[self.pos:])
+      if not match:
+        raise ParseError("Unexpected character while parsing attribute name: '%s'" % text[pos])
 
-  def push_attr(self):
-    """ Adds a new attribute to the dictionary. If this is called before a value is
-    set, the value will be None
-    """
+      name = match.group()
+      pos = match.end()
 
-    val = None
+      if pos == length:
+        break
 
-    # The attribute has already been set
-    if self.cur_attr.name in self.attrs:
-      raise ParseError("Found duplicate attribute: %s" % self.cur_attr.name)
+      char = text[pos]
 
-    if self.cur_attr.value is not None:
-      self.cur_attr.value = self.value_type(self.cur_attr.value)
+      if char == " ":
+        pos = regex_spaces.match(text, pos).end()
 
-    self.attrs[self.cur_attr.name] = self.cur_attr
-    self.cur_attr = Attribute()
-    self.quote_char = None
-    self.value_type = str
-    self.buffer = ""
+        if pos == length:
+          break
 
-  def _parse_pre_name_whitespace(self):
-    """ Skip whitespace and change states once we hit some characters that 
-    could be for an attribute name
+        char = text[pos]
 
-     vv        v
-    (  href="#" target="_blank")
-    """
+        if char != TOKEN_ATTR_SETVAL:
+          if char == end or regex_name.match(char):
+            # No value
+            self.push_attr(attrs, name)
+            continue
 
-    if self.char == " ":
-      return
+          raise ParseError("Unexpected character while parsing: '%s'" % char)
+      elif char == end:
+        self.push_attr(attrs, name)
+        return (attrs, pos + 1)
+      elif char != TOKEN_ATTR_SETVAL:
+        raise ParseError("Unexpected character while parsing attribute name: '%s'" % char)
 
-    if 'a' <= self.char.lower() <= 'z' or self.char == "-":
-      self.state = self.STATE_ATTR_NAME
-      self.buffer += self.char
-    elif self.char == TOKEN_ATTR_WRAPPER[1]:
-      self.state = self.STATE_DONE
-    else:
-      raise ParseError("Unexpected character while parsing attribute name: '%s'" % self.char)
+      # Attribute value
+      pos = regex_spaces.match(text, pos + 1).end()
 
-  def _parse_attr_name(self):
-    """ Parses an attribute name, building up the buffer as it reads in characters.
-    Once a non-attribute character is hit, the buffer is dumped into attr_name.
-    """
+      if pos == length:
+        break
 
-    if 'a' <= self.char.lower() <= 'z' or self.char == "-":
-      self.buffer += self.char
-    else:
-      self.cur_attr.name = self.buffer
-
-      if self.char == " ":
-        self.state = self.STATE_POST_NAME_WS
-      elif self.char == TOKEN_ATTR_SETVAL:
-        self.state = self.STATE_PRE_VALUE_WS
-        self.buffer = ""
-      elif self.char == TOKEN_ATTR_WRAPPER[1]:
-        self.state = self.STATE_DONE
-        self.push_attr()
-      else:
-        raise ParseError("Unexpected character while parsing attribute name: '%s'" % self.char)
+      char = text[pos]
 
-  def _parse_post_name_whitespace(self):
-    """ Skips whitespace after the attribute name until:
+      if char == "\"" or char == "'":
+        close = text.find(char, pos + 1)
 
-    - An equal sign is found (which means this attribute has a value)
-    - Attribute chars are found (which means no value, and another attribute)
-    """
+        if close == -1:
+          break
 
-    if self.char == " ":
-      return
-
-    if 'a' <= self.char.lower() <= 'z' or self.char == "-":
-      self.push_attr()
-      self.state = self.STATE_ATTR_NAME
-      self.buffer += self.char
-    elif self.char == TOKEN_ATTR_SETVAL:
-      self.state = self.STATE_PRE_VALUE_WS
-      self.buffer = ""
-    elif self.char == TOKEN_ATTR_WRAPPER[1]:
-      self.state = self.STATE_DONE
-      self.push_attr()
-    else:
-      raise ParseError("Unexpected character while parsing: '%s'" % self.char)
+        self.push_attr(attrs, name, text[pos + 1:close], char)
+        pos = close + 1
+      elif "0" <= char <= "9":
+        match = regex_int.match(text, pos)
+        pos = match.end()
 
-  def _parse_pre_value_whitespace(self):
-    """ Skips whitespace before a value. If a character or quote is encountered, then the
-    value is set to be a string. Otherwise the value is set to be an int
-    """
+        if pos == length:
+          break
 
-    if self.char == " ":
-      return
-
-    if self.char == "\"":
-      self.cur_attr.quote_char = "\""
-      self.quote_char = "\""
-      self.state = self.STATE_VALUE
-    elif self.char == "\'":
-      self.cur_attr.quote_char = "\'"
-      self.quote_char = "\'"
-      self.state = self.STATE_VALUE
-    elif '0' <= self.char <= '9':
-      self.value_type = int
-      self.buffer += self.char
-      self.state = self.STATE_VALUE
-    elif self.char == TOKEN_ATTR_WRAPPER[1]:
-      raise ParseError("Unexpected end of attributes (do you have an extra equals sign?)")
-    else:
-      raise ParseError("Unexpected character while parsing: '%s'" % self.char)
+        if text[pos] != " " and text[pos] != end:
+          raise ParseError("String attributes must be surrounded with quotes")
+
+        self.push_attr(attrs, name, int(match.group()))
+      elif char == end:
+        raise ParseError("Unexpected end of attributes (do you have an extra equals sign?)")
+      else:
+        raise ParseError("Unexpected character while parsing: '%s'" % char)
 
-  def _parse_value(self):
-    """ Parses the attribute's value. If the value is wrapped in quotes, extract
-    every character until we hit the closing quote. If it's a number, extract values
-    until we hit a space/other boundary
+    raise ParseError("Reached EOL while parsing attributes")
+
+  def push_attr(self, attrs, name, value=None, quote_char=""):
+    """ Adds a new attribute to the dictionary
     """
 
-    # If we hit the other quote char, or there was no quote char and we just hit some whitespace
-    if self.char == self.quote_char or self.char == " " and not self.quote_char:
-      self.state = self.STATE_PRE_NAME_WS
-      self.cur_attr.value = self.buffer
-      self.push_attr()
-    elif not self.quote_char and self.char == TOKEN_ATTR_WRAPPER[1]:
-      self.state = self.STATE_DONE
-      self.cur_attr.value = self.buffer
-      self.push_attr()
-    elif not ('0' <= self.char <= '9') and self.value_type == int:
-      raise ParseError("String attributes must be surrounded with quotes")
-    else:
-      self.buffer += self.char
\ No newline at end of file
+    # The attribute has already been set
+    if name in attrs:
+      raise ParseError("Found duplicate attribute: %s" % name)
+
+    max_attributes = self.options.get("max_attributes")
+
+    if max_attributes is not None and len(attrs) >= max_attributes:
+      raise ParseError("Tag has too many attributes (more than %d)" % max_attributes)
+
+    attr = Attribute()
+    attr.name = name
+    attr.value = value
+    attr.quote_char = quote_char
+    attrs[name] = attr
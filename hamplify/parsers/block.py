@@ -6,6 +6,78 @@ from hamplify.element import *
 
 regex_block = re.compile(r'- *(\w+)(.*)')
 
+class BlockRegistry(object):
+  """ Keeps track of which blocks each template engine has, so that a block can be found
+  by its name without searching through all of them. Blocks are defined the same way
+  as DJANGO_BLOCKS and JINJA_BLOCKS in config.py.
+
+  Blocks that aren't registered are parsed as inline blocks.
+  """
+
+  def __init__(self):
+    # Maps each engine to a dict of opening names to the tags of their block
+    self.openers = {}
+
+    # Maps each engine to a dict of intermediate names (elif, else, etc.) to the set of
+    # tags of the blocks they can appear in
+    self.intermediates = {}
+
+  def register(self, engine, tags):
+    """ Adds a block to an engine. `tags` is a tuple of the opening name, closing name,
+    and any intermediate names, e.g. ("cache", "endcache"). A block with the same
+    opening name is replaced
+    """
+
+    tags = tuple(tags)
+
+    if len(tags) < 2:
+      raise ValueError("A block needs an opening and a closing tag")
+
+    openers = self.openers.setdefault(engine, {})
+    intermediates = self.intermediates.setdefault(engine, {})
+
+    old = openers.get(tags[0])
+
+    if old is not None:
+      for name in old[2:]:
+        intermediates[name].discard(old)
+
+    openers[tags[0]] = tags
+
+    for name in tags[2:]:
+      intermediates.setdefault(name, set()).add(tags)
+
+  def copy(self):
+    """ Returns a registry with the same blocks in it, which can be added to without
+    changing this one
+    """
+
+    registry = BlockRegistry()
+
+    for engine, openers in self.openers.items():
+      for tags in openers.values():
+        registry.register(engine, tags)
+
+    return registry
+
+# The registry used by parsers that aren't given one
+default_registry = BlockRegistry()
+
+for tags in DJANGO_BLOCKS:
+  default_registry.register(ENGINE_DJANGO, tags)
+
+for tags in JINJA_BLOCKS:
+  default_registry.register(ENGINE_JINJA, tags)
+
+def register_block(engine, opening, closing, *intermediates):
+  """ Adds a block to the default registry, for template tags that aren't built into
+  the engine. For example, to use django's cache tag:
+
+  register_block(ENGINE_DJANGO, "cache", "endcache")
+  """
+
+  default_registry.register(engine, (opening, closing) + intermediates)
+
 class BlockParser(BaseParser):
   """ Blocks are used in template engines like Django and Jinja2 for providing 
   some realtime processing of context data
@@ -15,7 +87,9 @@ class BlockParser(BaseParser):
     super(BlockParser, self).__init__(options)
 
   def parse(self, text, sibling=None):
-    if not self.options.get("engine"):
+    engine = self.options.get("engine")
+
+    if not engine:
       raise ParseError("Block support has not been set")
 
     match = regex_block.match(text)
@@ -23,44 +97,43 @@ class BlockParser(BaseParser):
     if not match:
       raise ParseError("Encountered a block with no arguments")
 
-    name = match.group(1)
-    args = match.group(2)
+    registry = self.options.get("blocks") or default_registry
 
-    if self.options.get("engine") == ENGINE_DJANGO:
-      return self.new_block(DJANGO_BLOCKS, name, args, sibling)
-    elif self.options.get("engine") == ENGINE_JINJA:
-      return self.new_block(JINJA_BLOCKS, name, args, sibling)
+    return self.new_block(registry, engine, match.group(1), match.group(2), sibling)
 
-  def new_block(self, block_list, name, args, sibling):
+  def new_block(self, registry, engine, name, args, sibling):
     """ Returns a new Block element if the block is not inline for the given
     template engine. Otherwise returns an inline block
     """
 
     # Two blocks next to each other need to be linked
     if sibling and type(sibling) is Block and len(sibling.tags) > 2:
-      for k in block_list:
-        if name in sibling.tags[2:]:
-          block = Block()
+      intermediates = registry.intermediates.get(engine)
 
-          block.name = name
-          block.args = args[1:]
-          block.tags = sibling.tags
-          block.linked_to = sibling
-
-          sibling.render_end_tag = False
-
-          return block
-
-    for k in block_list:
-      if name == k[0]:
+      if intermediates and sibling.tags in intermediates.get(name, ()):
         block = Block()
 
         block.name = name
         block.args = args[1:]
-        block.tags = k
+        block.tags = sibling.tags
+        block.linked_to = sibling
+
+        sibling.render_end_tag = False
 
         return block
 
+    openers = registry.openers.get(engine)
+    tags = openers.get(name) if openers else None
+
+    if tags is not None:
+      block = Block()
+
+      block.name = name
+      block.args = args[1:]
+      block.tags = tags
+
+      return block
+
     return self.new_inline_block(name, args)
 
   def new_inline_block(self, name, args):
@@ -69,4 +142,4 @@ class BlockParser(BaseParser):
     block.name = name
     block.args = args[1:]
 
-    return block
\ No newline at end of file
+    return block
@@ -4,6 +4,29 @@ from .base import BaseParser
 from hamplify.config import *
 from hamplify.element import *
 
+# Filters registered by the application, mapping each name to the function that
+# compiles the body of the filter into html
+compiled_filters = {}
+
+def register_filter(name, func):
+  """ Adds a filter that's run when the template is parsed. `func` is given the body
+  of the filter as a string and returns the html to put in its place, e.g.
+
+  register_filter("markdown", markdown.markdown)
+
+  Then ":markdown" can be used like any other filter. The results are cached by a
+  hash of the body (see the parser's content_cache_size option), so `func` shouldn't
+  depend on anything but the body.
+  """
+
+  if _is_builtin(name):
+    raise ValueError("'%s' is a built in filter" % name)
+
+  compiled_filters[name] = func
+
+def _is_builtin(name):
+  return name == FILTER_PLAIN or name in FILTER_JAVASCRIPT or name in FILTER_CSS
+
 class FilterParser(BaseParser):
   def __init__(self, options=None):
     super(FilterParser, self).__init__(options)
@@ -16,6 +39,18 @@ class FilterParser(BaseParser):
     elif self._matches(text, FILTER_CSS):
       return FilterCSS()
 
+    if text.startswith(TOKEN_FILTER):
+      name = text[len(TOKEN_FILTER):]
+      filters = self.options.get("filters")
+
+      if filters is None:
+        filters = compiled_filters
+
+      func = filters.get(name)
+
+      if func is not None:
+        return FilterCompiled(name, func)
+
     return Text(text)
 
   def _matches(self, text, filters):
@@ -27,4 +62,4 @@ class FilterParser(BaseParser):
     if type(filters) is str:
       return text == filters
     elif type(filters) is list or type(filters) is tuple:
-      return text in filters
\ No newline at end of file
+      return text in filters
@@ -1,18 +1,156 @@
-import math, re
+import gc, itertools, multiprocessing, pickle, re
 
 from .base import BaseParser
+from hamplify.cache import ContentCache
 from hamplify.config import *
 from hamplify.element import *
-from hamplify.parsers.block import BlockParser
+from hamplify.flat import FlatTreeBuilder
+from hamplify.minify import minify_css, minify_js
+from hamplify.optimizer import fold_static
+from hamplify.packing import PackedElements
+from hamplify.parsers.block import BlockParser, default_registry
 from hamplify.parsers.comment import CommentParser
 from hamplify.parsers.doctype import DoctypeParser
-from hamplify.parsers.filter import FilterParser
+from hamplify.parsers.filter import FilterParser, compiled_filters
 from hamplify.parsers.tags import TagParser
 
 # Supports CRLF and LF newlines
 regex_newline = re.compile(r"\r?\n")
 
+# How many lines parse_stream reads in at a time
+STREAM_BATCH_SIZE = 1024
+
+# What compiled filters have to return
+try:
+  string_types = basestring
+except NameError:
+  string_types = str
+
+# The parser each worker process of Parser.parse_parallel uses
+_worker_parser = None
+
+def _init_worker(options):
+  global _worker_parser
+  _worker_parser = Parser(options)
+
+def _parse_chunk(job):
+  """ Parses part of a template in a worker process for Parser.parse_parallel. Returns
+  the number of elements that were parsed, and the top level elements packed into a
+  PackedElements
+  """
+
+  ws_char, ws_per_indent, line_number, lines = job
+
+  parser = _worker_parser
+
+  ctx = parser._new_context()
+  ctx.source = "\n".join(lines)
+  ctx.ws_char = ws_char
+  ctx.ws_per_indent = ws_per_indent
+  ctx.line_number = line_number
+
+  parser._parse_lines(ctx, lines)
+  parser._close(ctx)
+
+  return ctx.node_count, PackedElements.pack(ctx.root.children)
+
+class WriterSink(object):
+  """ Sink for parse_stream that renders elements straight into a writer
+  """
+
+  def __init__(self, write):
+    self.write = write
+
+  def open(self, e):
+    self.write(e._pre_render())
+
+  def close(self, e):
+    self.write(e._post_render())
+
+  def add(self, e):
+    e.render_to(self.write)
+
+class ParseContext(object):
+  """ Everything that changes while a template is being parsed. A new context is made
+  for every call to parse, so a single Parser can be shared between threads.
+  """
+
+  def __init__(self, sink=None, lean=False):
+    self.ws_per_indent = None
+    self.ws_char = None
+
+    self.root = RootNode()
+    self.cursor = self.root
+    self.stack = [self.root]
+
+    # The number of the line being parsed, and of the last line that was added to the tree
+    self.line_number = 0
+    self.last_line = 0
+
+    # The text being parsed and the offset of the next line in it, if the whole text
+    # is available. Filters store their lines as offsets into the source
+    self.source = None
+    self.offset = 0
+
+    # Only used when streaming (parse_stream, parse_flat). Elements are passed on to
+    # the sink and dropped from the tree as soon as they're finished. The sink is
+    # told when a node is opened and closed, and is given every other element whole
+    # with `add`. `open_elements` are the nodes that have been opened
+    self.sink = sink
+    self.open_elements = set()
+
+    # Whether blank lines and unrendered comments are left out of the tree
+    self.lean = lean
+
+    # Resource limits (None means there is no limit), and how much has been used
+    self.max_depth = None
+    self.max_input_size = None
+    self.max_line_length = None
+    self.max_nodes = None
+
+    self.input_size = 0
+    self.node_count = 0
+
 class Parser(BaseParser):
+  """ Parses HAML into a tree of elements.
+
+  Options:
+
+  blocks:          A BlockRegistry (see parsers/block.py) with the blocks each engine has.
+                   The default registry is used if this isn't set
+  content_cache_size:
+                   How many minified or compiled filter bodies to keep
+                   (CONTENT_CACHE_SIZE by default, 0 turns the cache off). The hit and
+                   miss counts are on content_cache
+  engine:          The template engine to use for blocks and variables (ENGINE_DJANGO or
+                   ENGINE_JINJA)
+  filters:         A dict of filter names to the functions that compile them, used instead
+                   of the filters added with register_filter (see parsers/filter.py)
+  fold_static:     Renders everything that isn't under a block or variable ahead of time
+                   (see optimizer.fold_static), so the tree only has to walk the dynamic
+                   parts when it's rendered again. Not used by parse_stream
+  interner:        A SubtreeInterner (see interning.py). Subtrees of the tree that match
+                   one the interner has already seen are replaced with the one it has, so
+                   trees parsed with the same interner share memory. Not used by parse_stream
+  lean:            Leaves blank lines and comments that aren't rendered (/) out of the tree.
+                   The rendered html is the same, but the tree uses less memory
+  line_cache_size: How many tag lines to keep parsed copies of (LINE_CACHE_SIZE by default,
+                   0 turns the cache off). The hit and miss counts are on
+                   tag_parser.line_cache
+  minify:          Minifies the bodies of :css and :javascript filters. The results are
+                   cached by a hash of the body (see content_cache_size), so a body that
+                   keeps coming up is only minified once
+
+  These limits are for parsing untrusted templates. Each one raises a ParseError as soon
+  as it is exceeded. They are all off by default.
+
+  max_attributes:  Most attributes a single tag can have
+  max_depth:       Most levels elements can be nested
+  max_input_size:  Most characters in the whole template
+  max_line_length: Most characters in a single line
+  max_nodes:       Most elements in the tree
+  """
+
   def __init__(self, options=None):
     super(Parser, self).__init__(options)
 
@@ -22,182 +160,700 @@ class Parser(BaseParser):
     self.filter_parser = FilterParser(options)
     self.tag_parser = TagParser(options)
 
-    self._reset()
+    # Lines are sorted by their first character so that each one is sent straight to
+    # the parser that can handle it. Anything not in here is plaintext
+    self.dispatch = {
+      TOKEN_COMMENT: self.comment_parser.parse,
+      TOKEN_DOCTYPE[0]: self._parse_doctype,
+      TOKEN_FILTER: self.filter_parser.parse,
+    }
 
-  def _reset(self):
-    self.ws_per_indent = None
-    self.ws_char = None
+    for t in TAG_TOKENS:
+      self.dispatch[t] = self.tag_parser.parse
 
-    self.root = RootNode()
-    self.cursor = self.root
-    self.stack = [self.root]
+    # Filters whose bodies are minified once they're closed
+    self.minifiers = {}
+
+    if self.options.get("minify"):
+      self.minifiers[FilterCSS] = minify_css
+      self.minifiers[FilterJavascript] = minify_js
+
+    self.content_cache = ContentCache(self.options.get("content_cache_size", CONTENT_CACHE_SIZE))
+
+  def _new_context(self, sink=None):
+    options = self.options
+    ctx = ParseContext(sink, options.get("lean", False))
+
+    ctx.max_depth = options.get("max_depth")
+    ctx.max_input_size = options.get("max_input_size")
+    ctx.max_line_length = options.get("max_line_length")
+    ctx.max_nodes = options.get("max_nodes")
+
+    return ctx
+
+  def _check_input_size(self, ctx, size):
+    """ Adds to the amount of text read in so far, and raises a ParseError if there's too much
+    """
+
+    ctx.input_size += size
+
+    if ctx.max_input_size is not None and ctx.input_size > ctx.max_input_size:
+      raise ParseError("Template is too large (more than %d characters)" % ctx.max_input_size)
 
   def parse(self, text):
     """ Parses a block of HAML and returns an element tree
     """
 
-    self._reset()
-    text = regex_newline.split(text)
-    line_number = 0
+    ctx = self._new_context()
+    ctx.source = text
+    self._check_input_size(ctx, len(text))
+    self._parse_lines(ctx, regex_newline.split(text))
+    self._close(ctx)
+
+    return ctx.root
+
+  def parse_stream(self, file_like, sink):
+    """ Parses HAML line by line from a file-like object, and writes the html to `sink`
+    (anything with a `write` method) as it goes. Elements are rendered as soon as they
+    are closed and then dropped, so memory use depends on how deeply the template is
+    nested rather than how long it is.
+
+    If a ParseError is raised, whatever was rendered up to that point will have
+    already been written to the sink.
+    """
+
+    ctx = self._new_context(WriterSink(sink.write))
+    ctx.open_elements.add(ctx.root)
+
+    lines = self._read_lines(ctx, file_like)
+
+    while True:
+      batch = list(itertools.islice(lines, STREAM_BATCH_SIZE))
+
+      if not batch:
+        break
+
+      self._parse_lines(ctx, batch)
+
+    self._close(ctx)
+    self._flush(ctx, ctx.root)
+
+  def parse_flat(self, text):
+    """ Parses a block of HAML into a FlatTree. Elements are added to the flat tree as
+    soon as they're finished, the same way parse_stream writes them, so the whole
+    element tree is never held in memory.
+    """
+
+    ctx = self._new_context()
+    ctx.sink = FlatTreeBuilder(ctx.root)
+    ctx.source = text
+    ctx.open_elements.add(ctx.root)
+
+    self._check_input_size(ctx, len(text))
+    self._parse_lines(ctx, regex_newline.split(text))
+    self._close(ctx)
+    self._flush(ctx, ctx.root)
+
+    return ctx.sink.finish()
+
+  def parse_parallel(self, text, processes=None, min_chunk_lines=2000):
+    """ Parses a large template using a pool of worker processes, and returns the same
+    tree that `parse` would.
+
+    Every line at the top level starts a new element of the root, so the source is split
+    into chunks of at least `min_chunk_lines` lines right before one of those lines. Blocks
+    are never split from the lines before them (blank lines and unrendered comments
+    included), since they could be linked to a block in the previous chunk. Each chunk is
+    parsed in its own process and the top level elements are joined back together
+    afterwards.
+
+    The options are sent to the workers along with the blocks and filters registered
+    with register_block and register_filter, so all of them have to be picklable (e.g.
+    filters can't be lambdas). The interner isn't sent, the joined tree is interned once
+    it's back.
+
+    Templates that are too small to split are parsed normally.
+    """
+
+    if processes is None:
+      processes = multiprocessing.cpu_count()
+
+    # The indentation has to be known before the chunks are parsed, so they all agree
+    ctx = self._new_context()
+    self._check_input_size(ctx, len(text))
+    lines = regex_newline.split(text)
+    widths, _, error = self._scan_indentation(ctx, lines)
+
+    # A line that's too long cuts the scan short, and mixed whitespace would fail in
+    # the chunk it's in. Parse normally so the first error in the template is raised
+    if error is not None:
+      return self.parse(text)
+
+    # Whether the first significant top level line from each line on is a block. Blank
+    # lines and unrendered comments (with the lines indented under them) are skipped
+    block_next = [False] * len(lines)
+    is_block = False
+
+    for i in range(len(lines) - 1, -1, -1):
+      if widths[i] == 0 and not lines[i].startswith(TOKEN_COMMENT):
+        is_block = lines[i].startswith(TOKEN_BLOCK)
+
+      block_next[i] = is_block
+
+    chunk_lines = max(min_chunk_lines, len(lines) // processes + 1)
+    jobs = []
+    start = 0
+
+    for i in range(chunk_lines, len(lines)):
+      if i - start >= chunk_lines and widths[i] == 0 and not block_next[i]:
+        jobs.append((ctx.ws_char, ctx.ws_per_indent, start, lines[start:i]))
+        start = i
+
+    if not jobs:
+      return self.parse(text)
+
+    jobs.append((ctx.ws_char, ctx.ws_per_indent, start, lines[start:]))
+
+    pool = multiprocessing.Pool(min(processes, len(jobs)), _init_worker, (self._worker_options(),))
+
+    # Every element that comes back is a new object that's still in use, so the garbage
+    # collector is paused instead of walking all of them over and over
+    collect = gc.isenabled()
+    gc.disable()
+
+    try:
+      results = pool.map(_parse_chunk, jobs)
+      too_many = ctx.max_nodes is not None and sum(count for count, packed in results) > ctx.max_nodes
+      children = [] if too_many else [e for count, packed in results for e in packed.unpack()]
+    finally:
+      pool.close()
+      pool.join()
+
+      if collect:
+        gc.enable()
+
+    # Each chunk was only checked against max_nodes on its own. Parsing normally stops
+    # at the limit and raises the same error that parse would
+    if too_many:
+      return self.parse(text)
+
+    root = ctx.root
+    root.line_end = len(lines)
+    root.ws_char = ctx.ws_char
+    root.ws_per_indent = ctx.ws_per_indent
+
+    for e in children:
+      root.add_child(e)
+
+    if self.options.get("interner") is not None:
+      self.options["interner"].intern(root)
+
+    return root
+
+  def _worker_options(self):
+    """ Returns the options for the parsers in parse_parallel's worker processes. The
+    registries are copied in, since a worker that doesn't fork won't have anything that
+    was registered after this module was imported. Raises a ValueError if the options
+    can't be sent to another process.
+    """
+
+    options = dict(self.options)
+    options.pop("interner", None)
+
+    if options.get("blocks") is None:
+      options["blocks"] = default_registry
+
+    if options.get("filters") is None:
+      options["filters"] = compiled_filters
+
+    try:
+      pickle.dumps(options)
+    except Exception as e:
+      raise ValueError("The parser's options can't be sent to the worker processes: %s" % e)
+
+    return options
+
+  def reparse(self, root, text, changed):
+    """ Updates a tree returned by `parse` after its source was edited, and returns it.
+
+    `text` is the full, edited source and `changed` is a list of (start, end) line ranges
+    (1-indexed and inclusive, numbered as they were in the old source) that were edited.
+    Only the top level elements that overlap the changes are parsed again. Every other
+    element is reused as is, with its line span shifted if lines were added or removed
+    above it.
+
+    If the edit can't be parsed on its own (e.g. a line was indented under an element
+    outside of the changed range, or the edit is at or before the first indented line,
+    which sets the indentation for the whole template) this falls back to a full parse.
+    """
+
+    self._check_input_size(self._new_context(), len(text))
+
+    lines = regex_newline.split(text)
+    children = root.children
+
+    if not children or not changed:
+      return self.parse(text)
+
+    lo = min(start for start, end in changed)
+    hi = max(end for start, end in changed)
+    delta = len(lines) - root.line_end
+
+    # The first indented line decides what the indentation looks like. If it could
+    # have been changed, everything after it has to be measured again
+    if not any(line[:1] in INDENTATION and line.strip() for line in lines[:lo - 1]):
+      return self.parse(text)
+
+    # Find the top level elements that overlap the changed lines
+    first = 0
+    while first < len(children) - 1 and children[first].line_end < lo:
+      first += 1
+
+    last = len(children) - 1
+    while last > first and children[last].line_start > hi:
+      last -= 1
+
+    first, last = self._expand_block_chains(children, first, last)
+
+    # Lines between top level elements (e.g. blank lines in lean mode) are parsed
+    # along with the elements around them
+    start = children[first - 1].line_end + 1 if first > 0 else 1
+    end = (children[last + 1].line_start - 1 if last + 1 < len(children) else root.line_end) + delta
+
+    ctx = self._new_context()
+    ctx.ws_char = root.ws_char
+    ctx.ws_per_indent = root.ws_per_indent
+    ctx.source = text
+
+    # The elements that are kept count against max_nodes as well
+    if ctx.max_nodes is not None:
+      ctx.node_count = self._count_elements(children[:first] + children[last + 1:])
+
+    if start > 1:
+      newline = next(itertools.islice(regex_newline.finditer(text), start - 2, None), None)
+
+      # There's no newline before `start` if the lines at the end were deleted
+      ctx.offset = newline.end() if newline is not None else len(text)
+
+    try:
+      ctx.line_number = start - 1
+      self._parse_lines(ctx, lines[start - 1:end])
+      self._close(ctx)
+    except ParseError:
+      return self.parse(text)
+
+    for e in children[last + 1:]:
+      self._shift_lines(e, delta)
+
+    for e in ctx.root.children:
+      e.set_parent(root)
+
+      # Same as add_child, the new elements are memoized if the tree is
+      if root._memo is not False and isinstance(e, Node):
+        e.enable_memoization()
+
+    root.children = children[:first] + ctx.root.children + children[last + 1:]
+    root._update_last_child()
+    root._changed()
+    root.line_end = len(lines)
+    root.ws_char = ctx.ws_char
+    root.ws_per_indent = ctx.ws_per_indent
+
+    return root
+
+  def _expand_block_chains(self, children, first, last):
+    """ Widens a range of top level elements so that it doesn't cut through a chain
+    of linked blocks (if/elif/else). The edit could also link or unlink the blocks
+    on either side of the range, so those are included as well.
+    """
+
+    def significant(i, step):
+      while 0 <= i < len(children) and not is_significant(children[i]):
+        i += step
+
+      return i if 0 <= i < len(children) else None
+
+    # Walk back to the head of the chain. The block just before the range could
+    # have new blocks linked to it
+    i = significant(first - 1, -1)
+
+    if i is not None and type(children[i]) is Block and len(children[i].tags) > 2:
+      first = i
+
+    while type(children[first]) is Block and children[first].linked_to is not None:
+      first = children.index(children[first].linked_to, 0, first)
+
+    # Blocks after the range are either linked to it, or are inline blocks that
+    # might be linked to it after the edit
+    i = significant(last + 1, 1)
+
+    while i is not None and (isinstance(children[i], InlineBlock) or
+        type(children[i]) is Block and children[i].linked_to is not None):
+      last = i
+      i = significant(i + 1, 1)
+
+    return first, last
+
+  def _shift_lines(self, element, delta):
+    """ Moves the line span of an element and all of its children
+    """
+
+    stack = [element]
+
+    while stack:
+      e = stack.pop()
+
+      if e.line_start is not None:
+        e.line_start += delta
+        e.line_end += delta
+
+      if isinstance(e, Node):
+        stack.extend(e.children)
+
+  def _count_elements(self, elements):
+    """ Counts the elements in a list and all of the elements under them
+    """
+
+    count = 0
+    stack = list(elements)
+
+    while stack:
+      e = stack.pop()
+      count += 1
+
+      if isinstance(e, Node):
+        stack.extend(e.children)
+
+    return count
+
+  def _parse_lines(self, ctx, lines):
+    """ Parses a list of lines and adds them to the tree. Line numbers carry on
+    from `ctx.line_number`
+    """
+
+    widths, levels, error = self._scan_indentation(ctx, lines)
+    source = ctx.source
+    offset = ctx.offset
     line = None
 
+    # Errors found by the scan are raised once the lines before them have been parsed,
+    # so that the first error in the template is the one that's reported
+    if error is not None:
+      widths = widths[:error[0]]
+
     try:
-      for line in text:
-        indentation = self._get_indentation(line)
-        line_number += 1
-
-        # If the line has indentation, then it cannot be blank/whitespace
-        if indentation is not None:
-
-          # Remove the indentation from the beginning of the line. We could do a lstrip
-          # here, but we want to preserve excess whitespace in comments and filter blocks
-          if self.ws_per_indent is not None:
-            line = line[int(indentation*self.ws_per_indent):]
-
-          level = self._block_level()
-
-          # Comments can span multiple lines, so make sure we don't parse them
-          if self._dont_parse(indentation):
-            self._push(Text(line))
-            continue
-
-          # Pop elements off the stack based on how the indentation changed
-          if indentation < level:
-            while indentation < level and level > 0:
-              self._pop()
-              level -= 1
-          elif indentation > level:
-            raise ParseError("Too much indentation (%d indents too many)" % (indentation - level))
-
-          element = self._parse_line(line)
-          self._push(element)
-        else:
-          self._push(Text())
+      for line, width, indentation in zip(lines, widths, levels):
+        ctx.line_number += 1
+
+        # Find where the next line starts in the source
+        start = offset
+
+        if source is not None:
+          offset += len(line)
+          offset += 2 if source.startswith("\r", offset) else 1
+
+        # Blank/whitespace line
+        if width is None:
+          if isinstance(ctx.cursor, Filter):
+            self._add_filter_line(ctx, line, start, len(line))
+          elif not ctx.lean:
+            self._push(ctx, Text())
+
+          continue
+
+        level = len(ctx.stack) - 1
+
+        # Comments can span multiple lines, so make sure we don't parse them. We only
+        # want to remove the minimum amount of whitespace necessary, and the indentation
+        # doesn't need to be a multiple of the previous indentation
+        if indentation >= level and not ctx.cursor._parse_children():
+          self._add_filter_line(ctx, line, start, level * ctx.ws_per_indent)
+          continue
+
+        if width != indentation * (ctx.ws_per_indent or 0):
+          raise ParseError("Uneven indentation level (expected multiple of %d)" % ctx.ws_per_indent)
+
+        # Remove the indentation from the beginning of the line. We could do a lstrip
+        # here, but we want to preserve excess whitespace in comments and filter blocks
+        if width:
+          line = line[width:]
+
+        # Pop elements off the stack based on how the indentation changed
+        if indentation < level:
+          while indentation < level and level > 0:
+            self._pop(ctx)
+            level -= 1
+        elif indentation > level:
+          raise ParseError("Too much indentation (%d indents too many)" % (indentation - level))
+
+        element = self._parse_line(ctx, line)
+        self._push(ctx, element)
+
+      ctx.offset = offset
+
+      if error is not None:
+        message, line = error[1:]
+        ctx.line_number += 1
+        raise ParseError(message)
     except ParseError as pe:
-      pe.line_number = line_number
-      pe.line = line
+      if pe.line_number is None:
+        pe.line_number = ctx.line_number
+        pe.line = line
+
       raise pe
 
-    return self.root
+  def _add_filter_line(self, ctx, line, start, indentation):
+    """ Adds a line to the filter or comment under the cursor, without the first
+    `indentation` characters. `start` is the offset of the line in the source.
+    """
+
+    cursor = ctx.cursor
+
+    # The comment isn't in the tree, so its lines don't need to be either
+    if ctx.lean and not cursor.render_children:
+      return
+
+    if ctx.source is not None and isinstance(cursor, Filter):
+      cursor.add_span(ctx.source, start + indentation, start + len(line))
+    else:
+      # Not pushed, so that the line isn't counted against max_nodes. It wouldn't be an
+      # element at all if there was a source to point into
+      text = Text(line[indentation:])
+      text.line_start = text.line_end = ctx.line_number
+      cursor.add_child(text)
+
+    ctx.last_line = ctx.line_number
+
+  def _scan_indentation(self, ctx, lines):
+    """ Measures the indentation of every line up front. Returns two lists: the number
+    of whitespace characters at the start of each line, and the indentation level that
+    it works out to. Both are None for blank lines.
 
-  def _parse_line(self, line):
-    """ Checks if the line starts with any tokens that designate a tag
-    or block, and parses it if it does. Otherwise returns a text object
+    The first indented line decides what the indentation looks like, which is saved
+    to the context. Lines that are too long or that mix tabs and spaces aren't raised
+    here, since there could be an error before them. The third value returned is the
+    (index, message, line) of the first one, or None.
     """
 
-    for t in COMMENT_TOKENS:
-      if line.startswith(t):
-        return self.comment_parser.parse(line)
+    error = None
 
-    for t in TAG_TOKENS:
-      if line.startswith(t):
-        return self.tag_parser.parse(line)
+    if ctx.max_line_length is not None and lines and max(map(len, lines)) > ctx.max_line_length:
+      i = next(i for i, line in enumerate(lines) if len(line) > ctx.max_line_length)
+      error = (i, "Line is too long (more than %d characters)" % ctx.max_line_length,
+        lines[i][:ctx.max_line_length] + "...")
+
+      # Nothing after the long line is parsed
+      lines = lines[:i]
+
+    widths = [len(line) - len(line.lstrip(INDENTATION_CHARS)) if line.strip() else None
+      for line in lines]
+
+    if ctx.ws_char is None:
+      for i, width in enumerate(widths):
+        if width:
+          ctx.ws_char = lines[i][width - 1]
+          ctx.ws_per_indent = width
+          break
+      else:
+        return widths, [None if width is None else 0 for width in widths], error
+
+    # Anything at the start of a line that isn't the indentation character is an error
+    other = INDENTATION_CHARS.replace(ctx.ws_char, "")
+    mixed = next((i for i, width in enumerate(widths) if width and lines[i].count(other, 0, width)), None)
+
+    if mixed is not None:
+      error = (mixed, "Mismatched whitespace at start of line (use spaces or tabs, not both)", lines[mixed])
+
+    ws_per_indent = ctx.ws_per_indent
+    levels = [None if width is None else width // ws_per_indent for width in widths]
+
+    return widths, levels, error
+
+  def _close(self, ctx):
+    """ Pops every open element once all of the lines have been parsed
+    """
+
+    while self._block_level(ctx) > 0:
+      self._pop(ctx)
 
-    if self.options.get("engine") and line.startswith(TOKEN_BLOCK):
-      block = self.block_parser.parse(line, self._get_newest_child())
-      return block 
+    ctx.root.line_end = ctx.line_number
+    ctx.root.ws_char = ctx.ws_char
+    ctx.root.ws_per_indent = ctx.ws_per_indent
 
+    if ctx.sink is None:
+      if self.options.get("fold_static"):
+        fold_static(ctx.root)
+
+      if self.options.get("interner") is not None:
+        self.options["interner"].intern(ctx.root)
+
+  def _read_lines(self, ctx, file_like):
+    """ Reads the lines of a file one at a time, without their newlines. When there are
+    limits, no more of a line is read in than it takes to know that it's too long, so
+    a huge line is never held in memory.
+    """
+
+    while True:
+      limit = -1
+
+      if ctx.max_line_length is not None:
+        # Room for a CRLF, and one more character so that a line that's too long still
+        # looks too long once its newline is removed
+        limit = ctx.max_line_length + 3
+
+      if ctx.max_input_size is not None:
+        remaining = ctx.max_input_size - ctx.input_size + 1
+        limit = remaining if limit < 0 else min(limit, remaining)
+
+      line = file_like.readline(limit)
+
+      if not line:
+        return
+
+      self._check_input_size(ctx, len(line))
+
+      yield self._strip_newline(line)
+
+  def _strip_newline(self, line):
+    """ Removes the trailing LF or CRLF from a line read from a file
+    """
+
+    if line.endswith("\r\n"):
+      return line[:-2]
+    elif line.endswith("\n"):
+      return line[:-1]
+
+    return line
+
+  def _parse_line(self, ctx, line):
+    """ Looks up the parser for the line's first character and parses the line
+    with it. Otherwise returns a text object
+    """
+
+    # Blocks need to see the element before them, so they're the only lines that
+    # need the parse context
+    if line[0] == TOKEN_BLOCK:
+      return self._parse_dash(ctx, line)
+
+    handler = self.dispatch.get(line[0])
+
+    if handler is None:
+      return Text(line)
+
+    return handler(line)
+
+  def _parse_dash(self, ctx, line):
+    """ Both HTML comments (-#) and blocks (-) start with a dash
+    """
+
+    if line.startswith(TOKEN_HTML_COMMENT):
+      return self.comment_parser.parse(line)
+
+    if self.options.get("engine"):
+      return self.block_parser.parse(line, self._get_newest_child(ctx))
+
+    return Text(line)
+
+  def _parse_doctype(self, line):
     if line.startswith(TOKEN_DOCTYPE):
       return self.doctype_parser.parse(line)
 
-    if line.startswith(TOKEN_FILTER):
-      return self.filter_parser.parse(line)
-
     return Text(line)
 
-  def _push(self, element):
+  def _push(self, ctx, element):
     """ Adds the element to the current element under the cursor, and pushes the
     element onto the stack if the element is a node (i.e. it can have children)
     """
 
-    self.cursor.add_child(element)
+    if ctx.max_depth is not None and len(ctx.stack) > ctx.max_depth:
+      raise ParseError("Elements are nested too deeply (more than %d levels)" % ctx.max_depth)
 
-    # The stack is only so we can establish a parent/child hierarchy.
-    # Elements which can't have children don't belong on the stack
-    if isinstance(element, Node):
-      self.stack.append(element)
-      self.cursor = element
+    ctx.node_count += 1
 
-  def _pop(self):
-    """ Removes the element at the top of the stack and returns it
-    """
+    if ctx.max_nodes is not None and ctx.node_count > ctx.max_nodes:
+      raise ParseError("Template has too many elements (more than %d)" % ctx.max_nodes)
 
-    if len(self.stack) == 1:
-      raise Exception("Tried to pop stack while it was empty")
+    significant = is_significant(element)
 
-    e = self.stack.pop()
-    self.cursor = self.stack[-1]
+    if not significant and ctx.lean and isinstance(element, Node):
+      # Unrendered comments are left out of the tree. They still go on the stack so
+      # that the lines inside of them are skipped over
+      ctx.stack.append(element)
+      ctx.cursor = element
+      return
 
-    return e
+    if ctx.sink is not None and ctx.cursor in ctx.open_elements:
+      # Blank lines and comments are held back since they could sit between two linked
+      # blocks, and the first block isn't finished until we know what comes after it
+      if significant:
+        self._flush(ctx, ctx.cursor)
 
-  def _block_level(self):
-    """ Gets the current depth of the parser. 
-    """
+    element.line_start = element.line_end = ctx.last_line = ctx.line_number
+    ctx.cursor.add_child(element)
 
-    return len(self.stack) - 1
+    # The stack is only so we can establish a parent/child hierarchy.
+    # Elements which can't have children don't belong on the stack
+    if isinstance(element, Node):
+      ctx.stack.append(element)
+      ctx.cursor = element
 
-  def _get_indentation(self, line):
-    """ Returns the indentation level of a line. Returns None if the line is blank
+      if ctx.sink is not None and element._parse_children() and element.render_children:
+        ctx.sink.open(element)
+        ctx.open_elements.add(element)
+        self._flush(ctx, element)
+
+  def _pop(self, ctx):
+    """ Removes the element at the top of the stack and returns it
     """
 
-    last = None
+    if len(ctx.stack) == 1:
+      raise Exception("Tried to pop stack while it was empty")
 
-    if not line.strip():
-      return None
+    e = ctx.stack.pop()
+    e.line_end = ctx.last_line
+    ctx.cursor = ctx.stack[-1]
 
-    for i in range(len(line)):
-      c = line[i]
+    if type(e) is FilterCompiled:
+      html = self.content_cache.get(e.func, e._render_children())
 
-      if c not in INDENTATION:
-        if not self.ws_char:
-          # This is not the first character in the line (i.e. the line has some indentation)
-          if last:
-            self.ws_char = last
-            self.ws_per_indent = i
+      # The filter has only just been closed, so the error points back at its first line
+      if not isinstance(html, string_types):
+        raise ParseError("Filter :%s returned %s instead of a string" % (e.name, type(html).__name__),
+          line_number=e.line_start, line=TOKEN_FILTER + e.name)
 
-            # The first indentation is the first level
-            return 1
-          else:
-            return 0
-        else:
-          indent = float(i) / self.ws_per_indent
-          floored = math.floor(indent)
+      e.set_body(html)
+    elif self.minifiers and type(e) in self.minifiers:
+      e.set_body(self.content_cache.get(self.minifiers[type(e)], e._render_children()))
 
-          # Indentation must be an even multiple of previous indentation, unless we're
-          # inside an element which is not parsed, like a comment or filter
-          if floored < indent and not self._dont_parse(floored):
-            raise ParseError("Uneven indentation level (expected multiple of %d)" % self.ws_per_indent)
+    if ctx.sink is not None and e in ctx.open_elements:
+      self._flush(ctx, e)
 
-          # If we're inside a block that should not be parsed, we only want to
-          # remove the minimum amount of whitespace necessary
-          if self._dont_parse(floored):
-            return self._block_level()
+    return e
 
-          return floored
+  def _flush(self, ctx, node):
+    """ Passes the children of an open node to the sink and removes them from the tree.
+    Every child must already be closed. Children that were opened in the sink only
+    need to be closed, since everything before that has already been passed on.
+    """
 
-      # The line starts with whitespace but does not match with what we expect
-      # the whitespace to be
-      elif self.ws_char and c != self.ws_char:
-        raise ParseError("Mismatched whitespace at start of line (use spaces or tabs, not both)")
+    for child in node.children:
+      if child in ctx.open_elements:
+        ctx.sink.close(child)
+        ctx.open_elements.discard(child)
+      else:
+        ctx.sink.add(child)
 
-      last = c
+    del node.children[:]
 
-  def _dont_parse(self, indentation=None):
-    """ Returns True if the cursor is currently inside an element
-    which should not have its children parsed
+  def _block_level(self, ctx):
+    """ Gets the current depth of the parser. 
     """
 
-    return indentation >= self._block_level() and isinstance(self.cursor, Node) and not self.cursor._parse_children()
+    return len(ctx.stack) - 1
 
-  def _get_newest_child(self):
+  def _get_newest_child(self, ctx):
     """ Returns the most recently added in child from the cursor, that isn't
     a blank text node. Returns None if no applicable node was found
     """
 
-    for child in self.cursor.children[::-1]:
-      if type(child) is Text and child.is_empty():
-        continue
-      else:
-        return child
-
-    return None
\ No newline at end of file
+    return ctx.cursor.last_child
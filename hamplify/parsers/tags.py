@@ -3,11 +3,14 @@ import re
 from .attributes import AttributeParser
 from .base import BaseParser
 from .variable import VariableParser
+from hamplify.cache import LineCache
 from hamplify.config import *
 from hamplify.element import SelfClosingTag, Tag, Text
 
-regex_tag_name = re.compile(r'([a-zA-Z][a-zA-Z0-9\-]*)')
-regex_class_id = re.compile(r'(?:\.|#)([a-zA-Z0-9_-]*)')
+# The tag name (if there is one) followed by any ids and classes
+regex_head = re.compile(r'([a-zA-Z][a-zA-Z0-9\-]*)?((?:[.#][a-zA-Z0-9_-]*)*)')
+regex_selector = re.compile(r'([.#])([a-zA-Z0-9_-]*)')
+regex_non_space = re.compile(r'\S')
 
 class TagParser(BaseParser):
   """ Regex parser for parsing out a %tag. 
@@ -18,135 +21,158 @@ class TagParser(BaseParser):
 
     self.ap = AttributeParser(options)
     self.vp = VariableParser(options)
-    self._reset()
 
-  def _reset(self):
-    self.tag = None
-    self.text = None
+    # The same tag lines tend to show up over and over, so the tags parsed from them
+    # are cached. The options can change after the parser is made, so the ones that
+    # change how a line is parsed are part of the key
+    self.line_cache = LineCache(self.options.get("line_cache_size", LINE_CACHE_SIZE))
 
   def parse(self, text):
     """ Parses a single line of text, and produces either a Tag or Text element.
     """
 
-    self._reset()
-    self.text = text
-
     if text:
       if text.startswith(TOKEN_TAG):
-        return self._parse()
+        return self._parse_cached(None, text)
       elif text.startswith(TOKEN_CLASS) or text.startswith(TOKEN_ID):
-        self.tag = Tag()
-        self.tag.tag = "div"
-        return self._parse(False)
+        return self._parse_cached("div", text)
 
     # Plaintext or blank line
-    return Text(self.text)
+    return Text(text)
 
-  def _parse(self, parse_name=True):
-    """ Parses a tag and any immediate text contents.
+  def _parse_cached(self, tag_name, text):
+    """ Parses a tag line, using the line cache if it's turned on
+    """
 
-    %p.style#id Lorem ipsum
+    cache = self.line_cache
 
-    Produces: <p class="style" id="id">Lorem ipsum</p>
-    """
+    if not cache.size:
+      return self._parse(self._make_tag(tag_name), text)
 
-    if parse_name:
-      self._parse_tag_name()
-      
-    self._parse_id()
-    self._parse_classes()
-    self._parse_id(True)
-    self._parse_attributes()
+    options = self.options
+    key = (text, options.get("engine"), options.get("max_attributes"))
+    tag = cache.get(key)
 
-    return self.tag
+    if tag is None:
+      tag = self._parse(self._make_tag(tag_name), text)
+      cache.put(key, tag)
 
-  def _parse_tag_name(self):
-    """ Extracts the tag name and strips it from the text.
+    return tag
 
-    [%p]#id.style#id
-    """
+  def _make_tag(self, tag_name):
+    if tag_name is None:
+      return None
 
-    # Remove the tag token
-    self.text = self.text[len(TOKEN_TAG):]
+    tag = Tag()
+    tag.tag = tag_name
 
-    if not self.text:
-      raise ParseError("Encountered a blank tag, expected a name")
+    return tag
 
-    tag_name = regex_tag_name.match(self.text)
+  def _parse(self, tag, text):
+    """ Parses a tag and any immediate text contents. If `tag` is None, the tag name
+    is parsed from the text.
 
-    if not tag_name:
-      raise ParseError("Expected a name for the tag, but instead found '%s'" % self.text[0])
+    %p.style#id Lorem ipsum
+
+    Produces: <p class="style" id="id">Lorem ipsum</p>
+
+    The head of the tag (the name, id and classes) is matched in one go, and then
+    walked through with offsets. The line is only sliced for the names and for the
+    text after the tag.
+    """
 
-    tag_name = tag_name.group(1)
+    if tag is None:
+      # Skip the tag token
+      pos = len(TOKEN_TAG)
 
-    if tag_name.lower() in SELF_CLOSING_TAGS:
-      self.tag = SelfClosingTag()
+      if pos == len(text):
+        raise ParseError("Encountered a blank tag, expected a name")
     else:
-      self.tag = Tag()
+      pos = 0
 
-    self.tag.tag = tag_name
-    self.text = self.text[len(tag_name):]
+    head = regex_head.match(text, pos)
 
-  def _parse_classes(self):
-    """ Extracts a list of classes (if any)
+    if tag is None:
+      tag_name = head.group(1)
 
-    %p#id[.style]#id
-    """
+      if not tag_name:
+        raise ParseError("Expected a name for the tag, but instead found '%s'" % text[pos])
+
+      if tag_name.lower() in SELF_CLOSING_TAGS:
+        tag = SelfClosingTag()
+      else:
+        tag = Tag()
 
-    while self.text and self.text.startswith(TOKEN_CLASS):
-      class_name = regex_class_id.match(self.text)
-      class_name = class_name.group(1)
+      tag.tag = tag_name
 
-      if not class_name:
-        raise ParseError("Encountered an empty class name")
+    self._parse_selectors(tag, text, head.start(2), head.end(2))
+    self._parse_rest(tag, text, head.end())
+    tag.freeze()
 
-      self.tag.classes.append(class_name)
-      self.text = self.text[len(class_name)+1:]
+    return tag
 
-  def _parse_id(self, end=False):
-    """ Extracts an ID for the element (if it has one). The ID can come at the beginning
-    or the end of the tag definition. If at the beginning, no classes may come before it.
-    If at the end, no classes may come after it.
+  def _parse_selectors(self, tag, text, start, end):
+    """ Extracts the id and classes. The id can come at the beginning or the end of the
+    tag definition. If at the beginning, no classes may come before it. If at the end,
+    no classes may come after it.
 
-    %p[#id].style[#id]
+    %p[#id.style#id]
     """
 
-    while self.text and self.text.startswith(TOKEN_ID):
-      # An ID was already set
-      if self.tag.id:
-        raise ParseError("Element cannot have more than 1 ID")
+    seen_class = False
+    end_id = False
+
+    for match in regex_selector.finditer(text, start, end):
+      token, name = match.groups()
+
+      if token == TOKEN_ID:
+        # An ID was already set
+        if tag.id:
+          raise ParseError("Element cannot have more than 1 ID")
+
+        if not name:
+          raise ParseError("Encountered an empty ID")
 
-      id_name = regex_class_id.match(self.text)
-      id_name = id_name.group(1)
+        tag.id = name
+        end_id = seen_class
+      else:
+        if end_id:
+          raise ParseError("Encountered a class after an ID (must be either before or after all of the classes)")
 
-      if not id_name:
-        raise ParseError("Encountered an empty ID")
+        if not name:
+          raise ParseError("Encountered an empty class name")
 
-      self.tag.id = id_name
-      self.text = self.text[len(id_name) + len(TOKEN_ID):]
+        tag.add_class(name)
+        seen_class = True
 
-    # The ID can be at the start or the end
-    if self.text and end and self.text.startswith(TOKEN_CLASS):
-      raise ParseError("Encountered a class after an ID (must be either before or after all of the classes)")
+  def _parse_rest(self, tag, text, pos):
+    """ Parses whatever comes after the tag head: attributes, and then either text or
+    a variable
+    """
 
-  def _parse_attributes(self):
-    if not self.text:
+    if pos == len(text):
       return
 
-    if self.text.startswith(TOKEN_ATTR_WRAPPER[0]):
-      (attrs, text) = self.ap.parse(self.text)
-
-      self.tag.attrs = attrs
-
-      if text.strip():
-        # '= var' found immediately after the tag
-        if text.startswith(TOKEN_VARIABLE):
-          self.tag.add_child(self.vp.parse(text))
-        else:
-          self.tag.add_child(Text(text.lstrip()))
-    elif self.text.startswith(" "):
-      self.tag.add_child(Text(self.text.lstrip()))
-    elif self.text.startswith(TOKEN_VARIABLE):
-      self.tag.add_child(self.vp.parse(self.text))
+    char = text[pos]
+
+    if char == TOKEN_ATTR_WRAPPER[0]:
+      tag.attrs, pos = self.ap.parse_at(text, pos)
+
+      # Only whitespace (or nothing) after the attributes
+      start = regex_non_space.search(text, pos)
+
+      if start is None:
+        return
+
+      # '= var' found immediately after the tag
+      if text.startswith(TOKEN_VARIABLE, pos):
+        tag.add_child(self.vp.parse(text[pos:]))
+      else:
+        tag.add_child(Text(text[start.start():]))
+    elif char == " ":
+      start = regex_non_space.search(text, pos)
+      tag.add_child(Text(text[start.start():] if start else ""))
+    elif char == TOKEN_VARIABLE:
+      tag.add_child(self.vp.parse(text[pos:]))
     else:
-      raise ParseError("Expected a '%s' or whitespace" % TOKEN_ATTR_WRAPPER[0])
\ No newline at end of file
+      raise ParseError("Expected a '%s' or whitespace" % TOKEN_ATTR_WRAPPER[0])
@@ -6,6 +6,7 @@ except ImportError:
   pass
 
 from hamplify.config import *
+from hamplify.minify import minify_html
 from hamplify.parsers.parser import Parser
 
 arg_parser = argparse.ArgumentParser(description="Convert HAML files to HTML.")
@@ -22,6 +23,8 @@ arg_parser.add_argument("--django", action="store_true",
   help="Parses the file(s) with Django syntax and tag names")
 arg_parser.add_argument("--jinja", action="store_true", 
   help="(default) Parses the file(s) with Jinja syntax and tag names")
+arg_parser.add_argument("-m", "--minify", action="store_true",
+  help="Minifies the html, and any css and javascript in :css and :javascript filters")
 arg_parser.add_argument("-w", "--watch", action="store_true",
   help="Watches the src directory for changes. Source path must refer to a directory if using this flag")
 
@@ -82,9 +85,9 @@ class HamplifyCompiler():
       exit(1)
 
     if args.django:
-      self.parser = Parser({"engine": ENGINE_DJANGO})
+      self.parser = Parser({"engine": ENGINE_DJANGO, "lean": True, "minify": args.minify})
     else:
-      self.parser = Parser({"engine": ENGINE_JINJA})
+      self.parser = Parser({"engine": ENGINE_JINJA, "lean": True, "minify": args.minify})
 
     # Output dir defaults to the source
     if not args.dst:
@@ -172,7 +175,12 @@ class HamplifyCompiler():
         buffer = fin.read()
 
         try:
-          fout.write(self.parser.parse(buffer).render())
+          root = self.parser.parse(buffer)
+
+          if args.minify:
+            fout.write(minify_html(root.render()))
+          else:
+            root.render_to(fout.write)
         except ParseError as pe:
           pe.file_path = os.path.relpath(in_file)
           print(color(pe, "red"))
@@ -102,4 +102,27 @@ class TestAttributeParser(unittest.TestCase):
       self.ap.parse('(incomplete="test)')
 
     with self.assertRaises(ParseError):
-      self.ap.parse('(id="myid" id="anotherid")')
\ No newline at end of file
+      self.ap.parse('(id="myid" id="anotherid")')
+
+  def test_error_messages(self):
+    errors = {
+      '(href="#" =123)': "Unexpected character while parsing attribute name: '='",
+      '(name$=123)': "Unexpected character while parsing attribute name: '$'",
+      '(target=_blank)': "Unexpected character while parsing: '_'",
+      '(incomplete ^)': "Unexpected character while parsing: '^'",
+      '(rows=5a)': "String attributes must be surrounded with quotes",
+      '(incomplete=)': "Unexpected end of attributes (do you have an extra equals sign?)",
+      '(incomplete="test)': "Reached EOL while parsing attributes",
+      '(a b=1 a)': "Found duplicate attribute: a",
+    }
+
+    for text, message in errors.items():
+      with self.assertRaises(ParseError) as cm:
+        self.ap.parse(text)
+
+      self.assertEqual(cm.exception.message, message)
+
+  def test_parse_at(self):
+    attrs, pos = self.ap.parse_at("%p(a='1' b) text", 2)
+    assert [a.name for a in attrs.values()] == ["a", "b"]
+    assert pos == 11
@@ -2,7 +2,7 @@ import unittest
 
 from hamplify.element import *
 from hamplify.config import *
-from hamplify.parsers.block import BlockParser
+from hamplify.parsers.block import BlockParser, default_registry
 
 class TestBlockParser(unittest.TestCase):
   bp = BlockParser()
@@ -36,4 +36,46 @@ class TestBlockParser(unittest.TestCase):
     self.bp.options["engine"] = ENGINE_DJANGO
 
     with self.assertRaises(ParseError):
-      self.bp.parse("- ")
\ No newline at end of file
+      self.bp.parse("- ")
+
+  def test_linked_blocks(self):
+    self.bp.options["engine"] = ENGINE_JINJA
+
+    block = self.bp.parse("- for x in list")
+    other = self.bp.parse("- else", block)
+    assert other.linked_to is block
+    assert not block.render_end_tag
+
+    # Django's for loops use empty, not else
+    self.bp.options["engine"] = ENGINE_DJANGO
+
+    block = self.bp.parse("- for x in list")
+    other = self.bp.parse("- else", block)
+    assert type(other) is InlineBlock
+
+  def test_registry(self):
+    registry = default_registry.copy()
+    registry.register(ENGINE_DJANGO, ("cache", "endcache"))
+    registry.register(ENGINE_DJANGO, ("switch", "endswitch", "case"))
+    self.bp.options = {"engine": ENGINE_DJANGO, "blocks": registry}
+
+    block = self.bp.parse("- cache 500 sidebar")
+    assert type(block) is Block
+    assert block._post_render() == "{% endcache %}"
+
+    block = self.bp.parse("- switch x")
+    other = self.bp.parse("- case 1", block)
+    assert other.linked_to is block
+
+    block = self.bp.parse("- if x")
+    assert block.tags == ("if", "endif", "elif", "else")
+
+    # The default registry isn't changed
+    assert "cache" not in default_registry.openers[ENGINE_DJANGO]
+
+    # Replacing a block drops its old intermediates
+    registry.register(ENGINE_DJANGO, ("switch", "endswitch"))
+    assert type(self.bp.parse("- case 1", self.bp.parse("- switch x"))) is InlineBlock
+
+    with self.assertRaises(ValueError):
+      registry.register(ENGINE_DJANGO, ("cache",))
@@ -13,4 +13,130 @@ class TestElements(unittest.TestCase):
 
   def test_no_root_parent(self):
     with self.assertRaises(Exception):
-      RootNode().set_parent(Node())
\ No newline at end of file
+      RootNode().set_parent(Node())
+
+  def test_last_child(self):
+    node = Node()
+    assert node.last_child is None
+
+    p = Text("text")
+    node.add_child(p)
+    node.add_child(Text())
+    node.add_child(Text("   "))
+    assert node.last_child is p
+
+  def test_render_to(self):
+    root = RootNode()
+    tag = Tag()
+    tag.tag = "div"
+    tag.add_child(Text("hello"))
+    root.add_child(tag)
+
+    f = FilterPlain()
+    f.add_child(Text("a\n"))
+    f.add_child(Text(""))
+    f.add_child(Text("b"))
+    f.add_span("c\n\n", 0, 3)
+    root.add_child(f)
+
+    out = []
+    root.render_to(out.append)
+    assert "".join(out) == root.render()
+    assert f.render() == "a\n\n\nb\nc"
+
+  def test_iter_render(self):
+    root = RootNode()
+    node = root
+
+    for i in range(5000):
+      tag = Tag()
+      tag.tag = "div"
+      node.add_child(tag)
+      node = tag
+
+    node.add_child(Text("hello"))
+
+    f = FilterPlain()
+    f.add_child(Text("a"))
+    f.add_child(Text("b\n"))
+    root.add_child(f)
+
+    expected = "<div>" * 5000 + "hello" + "</div>" * 5000 + "a\nb"
+    assert "".join(root.iter_render()) == expected
+
+    chunks = list(root.iter_render(chunk_size=100))
+    assert "".join(chunks) == expected
+    assert all(len(c) >= 100 for c in chunks[:-1])
+    assert len(chunks) > 1
+
+  def test_slots(self):
+    for e in (Text(), Tag(), SelfClosingTag(), Block(), InlineBlock(), FilterCSS()):
+      assert not hasattr(e, "__dict__")
+
+    tag = Tag()
+    assert tag._get_class_string() == ""
+    tag.add_class("a")
+    tag.add_class("b")
+    assert tag.classes == ["a", "b"]
+
+  def test_memoization(self):
+    root = RootNode()
+    rows = []
+
+    for i in range(3):
+      row = Tag()
+      row.tag = "tr"
+      cell = Tag()
+      cell.tag = "td"
+      cell.add_child(Text(str(i)))
+      row.add_child(cell)
+      root.add_child(row)
+      rows.append(row)
+
+    root.enable_memoization()
+    assert root.render() == "<tr><td>0</td></tr><tr><td>1</td></tr><tr><td>2</td></tr>"
+    memo = rows[0]._memo
+
+    rows[1].children[0].children[0].set_text("x")
+    assert root._memo is None and rows[1]._memo is None
+    assert rows[0]._memo is memo
+
+    rows[2].children[0].add_class("last")
+    rows[2].set_attribute("data-row", 2)
+    assert root.render() == ("<tr><td>0</td></tr><tr><td>x</td></tr>"
+      '<tr data-row=2><td class="last">2</td></tr>')
+
+    new = Tag()
+    new.tag = "p"
+    root.replace_child(rows[0], new)
+    root.remove_child(rows[1])
+    new.add_child(Text("new"))
+    assert root.last_child is rows[2]
+    assert root.render() == '<p>new</p><tr data-row=2><td class="last">2</td></tr>'
+    assert "".join(root.iter_render()) == root.render()
+
+  def test_clone(self):
+    root = RootNode()
+    tag = Tag()
+    tag.tag = "p"
+    tag.add_class("a")
+    root.add_child(tag)
+
+    first = Block()
+    first.name = "if"
+    first.tags = ("if", "endif", "else")
+    first.render_end_tag = False
+    second = Block()
+    second.name = "else"
+    second.tags = first.tags
+    second.linked_to = first
+    tag.add_child(first).add_child(second)
+    first.add_child(Text("one"))
+
+    copy = root.clone()
+    assert copy.render() == root.render()
+
+    p = copy.children[0]
+    assert p is not tag and p.parent is copy and p.classes is not tag.classes
+    assert p.children[1].linked_to is p.children[0]
+    assert p.last_child is p.children[1]
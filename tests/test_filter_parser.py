@@ -2,7 +2,7 @@ import unittest
 
 from hamplify.element import *
 from hamplify.config import ParseError
-from hamplify.parsers.filter import FilterParser
+from hamplify.parsers.filter import FilterParser, register_filter
 
 class TestCommentParser(unittest.TestCase):
   fp = FilterParser()
@@ -21,4 +21,18 @@ class TestCommentParser(unittest.TestCase):
   def test_css_filter(self):
     self.assertIsInstance(self.fp.parse(":css"), FilterCSS)
     self.assertIsInstance(self.fp.parse(":style"), FilterCSS)
-    self.assertIsInstance(self.fp.parse(":stylesheet"), FilterCSS)
\ No newline at end of file
+    self.assertIsInstance(self.fp.parse(":stylesheet"), FilterCSS)
+
+  def test_compiled_filter(self):
+    fp = FilterParser({"filters": {"upper": str.upper}})
+
+    e = fp.parse(":upper")
+    self.assertIsInstance(e, FilterCompiled)
+    assert e.name == "upper"
+    assert e.func is str.upper
+
+    assert type(fp.parse(":lower")) is Text
+    self.assertIsInstance(fp.parse(":css"), FilterCSS)
+
+    with self.assertRaises(ValueError):
+      register_filter("js", str.upper)
@@ -0,0 +1,65 @@
+import pickle
+import unittest
+
+from hamplify.element import *
+from hamplify.config import *
+from hamplify.flat import *
+from hamplify.parsers.parser import Parser
+
+class TestFlatTree(unittest.TestCase):
+  template = """
+!!! 5
+%html
+  %body#main.page(data-x="1")
+    / not rendered
+      %p hidden
+    -# rendered comment
+    %ul
+      - for item in items
+        %li= item
+
+      - empty
+        %li none
+    :javascript
+      var a = 1;
+
+      a++;
+    %br
+"""
+
+  def test_from_element(self):
+    p = Parser({"engine": ENGINE_DJANGO})
+    root = p.parse(self.template)
+    tree = FlatTree.from_element(root)
+
+    assert tree.render() == root.render()
+    assert tree.kinds[0] == KIND_ROOT
+    assert tree.parents[0] == -1
+
+    html = [i for i in tree.iter_children(0) if tree.kinds[i] == KIND_TAG][0]
+    body = list(tree.iter_children(html))[0]
+
+    kinds = [tree.kinds[i] for i in tree.iter_children(body)]
+    assert kinds == [KIND_COMMENT, KIND_COMMENT, KIND_TAG, KIND_FILTER, KIND_SELF_CLOSING_TAG, KIND_TEXT]
+
+    # Unrendered comments and filters are stored whole
+    for i in tree.iter_children(body):
+      if tree.kinds[i] in (KIND_COMMENT, KIND_FILTER):
+        assert tree.first_child[i] == -1
+
+    for i in range(1, len(tree)):
+      assert tree.parents[i] < i
+
+  def test_parse_flat(self):
+    p = Parser({"engine": ENGINE_DJANGO})
+    root = p.parse(self.template)
+    expected = FlatTree.from_element(root)
+    tree = p.parse_flat(self.template)
+
+    assert tree.render() == root.render()
+    assert tree.kinds == expected.kinds
+    assert tree.parents == expected.parents
+    assert tree.next_sibling == expected.next_sibling
+
+    copy = pickle.loads(pickle.dumps(tree, pickle.HIGHEST_PROTOCOL))
+    assert copy.render() == tree.render()
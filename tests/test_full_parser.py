@@ -1,8 +1,17 @@
+import pickle
+import random
+import threading
 import unittest
 
+# io.StringIO only takes unicode on python 2, and the parser writes native strings
+try:
+  from StringIO import StringIO
+except ImportError:
+  from io import StringIO
+
 from hamplify.element import *
 from hamplify.config import *
-from hamplify.parsers.parser import Parser
+from hamplify.parsers.parser import ParseContext, Parser
 
 class TestFullParser(unittest.TestCase):
   p = None
@@ -11,58 +20,70 @@ class TestFullParser(unittest.TestCase):
     self.p = Parser()
 
   def test_cant_pop_empty_stack(self):
-    self.p._reset()
-
     with self.assertRaises(Exception):
-      self.p._pop()
+      self.p._pop(ParseContext())
 
   def test_single_line_indentation(self):
-    self.p._reset()
-    assert None == self.p._get_indentation("")
-
-    self.p._reset()
-    assert None == self.p._get_indentation("  ")
+    assert ([None], [None], None) == self.p._scan_indentation(ParseContext(), [""])
+    assert ([None], [None], None) == self.p._scan_indentation(ParseContext(), ["  "])
+    assert ([0], [0], None) == self.p._scan_indentation(ParseContext(), ["text"])
 
-    self.p._reset()
-    assert 0 == self.p._get_indentation("text")
-
-    self.p._reset()
-    assert 1 == self.p._get_indentation("  text")
-    assert self.p.ws_per_indent == 2
-    assert self.p.ws_char == " "
+    ctx = ParseContext()
+    assert ([2], [1], None) == self.p._scan_indentation(ctx, ["  text"])
+    assert ctx.ws_per_indent == 2
+    assert ctx.ws_char == " "
 
   def test_indentation(self):
-    self.p._reset()
-    assert 0 == self.p._get_indentation("some text  ")
-    assert 1 == self.p._get_indentation("  Indented")
-    assert 2 == self.p._get_indentation("    Some more")
-    assert None == self.p._get_indentation("        ")
-    assert 1 == self.p._get_indentation("  Back down")
-
-    assert 0 == self.p._get_indentation("- for x in list")
-    assert 1 == self.p._get_indentation("  {{x}}")
+    ctx = ParseContext()
+    widths, levels, error = self.p._scan_indentation(ctx, [
+      "some text  ",
+      "  Indented",
+      "    Some more",
+      "        ",
+      "  Back down",
+      "- for x in list",
+      "  {{x}}",
+      "   uneven",
+    ])
+
+    assert widths == [0, 2, 4, None, 2, 0, 2, 3]
+    assert levels == [0, 1, 2, None, 1, 0, 1, 1]
+    assert error is None
 
   def test_mixed_indentation(self):
-    self.p._reset()
-    self.p.ws_per_indent = 2
-    self.p.ws_char = " "
+    for line in ("\tTabs", "\t  Mixed", "  \tMixed"):
+      ctx = ParseContext()
+      ctx.ws_per_indent = 2
+      ctx.ws_char = " "
 
-    with self.assertRaises(ParseError):
-      self.p._get_indentation("\tTabs")
+      error = self.p._scan_indentation(ctx, ["%p", line])[2]
+      assert error[0] == 1
+      assert "Mismatched" in error[1]
 
-    with self.assertRaises(ParseError):
-      self.p._get_indentation("\t  Mixed")
+    try:
+      self.p.parse("%div\n  %p\n\n  %p\n \t%a")
+      assert False
+    except ParseError as pe:
+      assert pe.line_number == 5
+      assert "Mismatched" in pe.message
 
-    with self.assertRaises(ParseError):
-      self.p._get_indentation("  \tMixed")
+    # An error on an earlier line is reported first
+    try:
+      self.p.parse("%p(unclosed\n  %a\n\t%b")
+      assert False
+    except ParseError as pe:
+      assert pe.line_number == 1
+      assert "Mismatched" not in pe.message
 
   def test_uneven_indentation(self):
-    self.p._reset()
-    self.p.ws_per_indent = 4
-    self.p.ws_char = " "
+    with self.assertRaises(ParseError) as cm:
+      self.p.parse("%div\n    %p\n  2 spaces instead of 4")
 
-    with self.assertRaises(ParseError):
-      self.p._get_indentation("  2 spaces instead of 4")
+    assert cm.exception.line_number == 3
+
+    # Comments and filters don't need to be indented evenly
+    html = self.p.parse("%div\n    :plain\n         one\n          two\n    %p")
+    assert html.render() == "<div> one\n  two<p></p></div>"
 
   def test_indentation_jump(self):
     with self.assertRaises(ParseError):
@@ -180,4 +201,468 @@ some text
     %test
       """)
 
-    assert html.render() == '<!--[if IE]><script src="run_this.js"></script>%test<![endif]-->'
\ No newline at end of file
+    assert html.render() == '<!--[if IE]><script src="run_this.js"></script>%test<![endif]-->'
+
+  def test_line_dispatch(self):
+    ctx = ParseContext()
+
+    assert type(self.p._parse_line(ctx, "plain text")) is Text
+    assert type(self.p._parse_line(ctx, "%p")) is Tag
+    assert type(self.p._parse_line(ctx, ".class")) is Tag
+    assert type(self.p._parse_line(ctx, "#id")) is Tag
+    assert type(self.p._parse_line(ctx, "-# comment")) is Comment
+    assert type(self.p._parse_line(ctx, "/ comment")) is Comment
+    assert type(self.p._parse_line(ctx, ":plain")) is FilterPlain
+    assert self.p._parse_line(ctx, "!!!").render() == "<!DOCTYPE html>"
+
+    # Blocks are plaintext unless an engine is set
+    assert self.p._parse_line(ctx, "- for x in y").render() == "- for x in y"
+    assert self.p._parse_line(ctx, "!! not a doctype").render() == "!! not a doctype"
+
+  def test_parse_stream(self):
+    templates = ["""
+!!!
+%html
+  %head
+    %title My cool title
+  %body
+    .container
+      %p some text
+      / comment you can't see %tag.blah
+        still a comment
+
+      -# HTML comment
+         some stuff
+    :javascript
+      var x = 1;
+
+      // Comment
+""", """
+- for x in list
+  {{x}}
+- if condition
+  - if another condition
+    something
+    - custom_tag
+  %a(href="#") link
+
+- else
+  {{stuff}}
+-#[if IE]
+  %p= var
+some text"""]
+
+    for template in templates:
+      expected = Parser({"engine": ENGINE_DJANGO}).parse(template).render()
+      out = StringIO()
+
+      self.p = Parser({"engine": ENGINE_DJANGO})
+      self.p.parse_stream(StringIO(template), out)
+
+      assert out.getvalue() == expected
+
+  def test_parse_stream_drops_closed_elements(self):
+    class CountingParser(Parser):
+      most_children = 0
+
+      def _flush(self, ctx, node):
+        self.most_children = max(self.most_children, len(ctx.root.children))
+        super(CountingParser, self)._flush(ctx, node)
+
+    self.p = CountingParser()
+    self.p.parse_stream(StringIO("%div\n  %p text\n" * 1000), StringIO())
+
+    assert self.p.most_children <= 2
+
+  def test_line_spans(self):
+    html = self.p.parse("%div\n  %p text\n\n  %p\n    more\n%span")
+
+    div, span = html.children[0], html.children[1]
+    assert (div.line_start, div.line_end) == (1, 5)
+    assert (div.children[0].line_start, div.children[0].line_end) == (2, 3)
+    assert (span.line_start, span.line_end) == (6, 6)
+    assert html.line_end == 6
+
+  def test_reparse(self):
+    self.p = Parser({"engine": ENGINE_DJANGO})
+
+    before = "%head\n  %title Title\n%body\n  %p one\n  %p two\n%footer\n  text"
+    after = "%head\n  %title Title\n%body\n  %p one\n  %p three\n  %p four\n%footer\n  text"
+
+    html = self.p.parse(before)
+    head, footer = html.children[0], html.children[2]
+
+    html = self.p.reparse(html, after, [(5, 5)])
+
+    assert html.render() == Parser({"engine": ENGINE_DJANGO}).parse(after).render()
+    assert html.children[0] is head
+    assert html.children[2] is footer
+    assert (footer.line_start, footer.line_end) == (7, 8)
+    assert footer.children[0].line_start == 8
+    assert html.children[1].parent is html
+
+    # A memoized tree renders the edit, and keeps memoizing what was parsed again
+    html = self.p.parse(before)
+    html.enable_memoization()
+    html.render()
+
+    html = self.p.reparse(html, after, [(5, 5)])
+    assert html.render() == Parser({"engine": ENGINE_DJANGO}).parse(after).render()
+    assert html.children[1]._memo is not None
+
+    html.children[1].children[-1].children[0].set_text("five")
+    assert "five" in html.render()
+
+  def test_reparse_block_chains(self):
+    self.p = Parser({"engine": ENGINE_DJANGO})
+    full = Parser({"engine": ENGINE_DJANGO})
+
+    before = "- if a\n  one\n%p\n- else"
+    after = "- if a\n  one\n- else"
+
+    html = self.p.reparse(self.p.parse(before), after, [(3, 3)])
+    assert html.render() == full.parse(after).render() == "{% if a %}one{% else %}{% endif %}"
+
+    html = self.p.reparse(html, before, [(3, 3)])
+    assert html.render() == full.parse(before).render()
+
+    # Adding an `if` in front of an existing `else`
+    after = "%p\n- if b\n  three\n- else"
+    html = self.p.reparse(self.p.parse("%p\n- else"), after, [(1, 1)])
+    assert html.render() == full.parse(after).render()
+
+  def test_reparse_fallback(self):
+    html = self.p.parse("%div\n%p")
+    html = self.p.reparse(html, "%div\n  %p", [(2, 2)])
+
+    assert html.render() == "<div><p></p></div>"
+
+    with self.assertRaises(ParseError):
+      self.p.reparse(html, "%div\n  %p\n      %a", [(3, 3)])
+
+  def test_reparse_matches_parse(self):
+    def render(parse):
+      try:
+        return parse().render()
+      except ParseError as pe:
+        return pe.message
+
+    # Deleting the last lines, and changing the line that sets the indentation
+    html = self.p.reparse(self.p.parse("- empty\n/ hidden"), "- empty", [(2, 2)])
+    assert html.render() == "- empty"
+
+    before = "- include 'x'\n:javascript\n  %p\n    text here"
+    after = "- include 'x'\n:javascript\n    text here"
+    html = self.p.reparse(self.p.parse(before), after, [(3, 3)])
+    assert html.render() == '- include \'x\'<script type="text/javascript">text here</script>'
+
+    pool = ["%p", "%div", "%p text", "- if a", "- elif b", "- else", "- for x in y", "- empty",
+      "- include 'x'", ":javascript", "/ c", "-# hidden", "text", "", "%br"]
+    indents = ["", "", "  ", "    ", "      ", "\t", " "]
+    rand = random.Random(0)
+
+    def make_lines(n):
+      return [rand.choice(indents) + rand.choice(pool) for _ in range(n)]
+
+    for i in range(1000):
+      lines = make_lines(rand.randint(1, 8))
+      start = rand.randint(1, len(lines))
+      end = rand.randint(start, len(lines))
+      before = "\n".join(lines)
+      after = "\n".join(lines[:start - 1] + make_lines(rand.randint(0, 3)) + lines[end:])
+
+      p = Parser({"engine": ENGINE_DJANGO})
+
+      try:
+        html = p.parse(before)
+      except ParseError:
+        continue
+
+      expected = render(lambda: Parser({"engine": ENGINE_DJANGO}).parse(after))
+      assert render(lambda: p.reparse(html, after, [(start, end)])) == expected, (before, after)
+
+  def test_shared_between_threads(self):
+    self.p = Parser({"engine": ENGINE_JINJA})
+    templates = []
+
+    for i in range(8):
+      templates.append("\n".join([
+        "%%div.t%d#id-%d(data-n=%d title='%d')" % (i, i, i, i),
+        "  - for x in list_%d" % i,
+        "    %%p.row(class='c%d')= x" % i,
+        "  - if cond_%d" % i,
+        "    :plain",
+        "      %d" % i,
+        "  - else",
+        "    -# comment %d" % i,
+      ] * (i + 1)))
+
+    expected = [Parser({"engine": ENGINE_JINJA}).parse(t).render() for t in templates]
+    errors = []
+
+    def run(i):
+      try:
+        for _ in range(50):
+          if self.p.parse(templates[i]).render() != expected[i]:
+            errors.append(i)
+      except Exception as e:
+        errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(templates))]
+
+    for t in threads:
+      t.start()
+
+    for t in threads:
+      t.join()
+
+    assert errors == []
+
+  def test_parse_parallel(self):
+    self.p = Parser({"engine": ENGINE_DJANGO})
+
+    template = "\n".join([
+      "%div.a",
+      "  %p= x",
+      "  :plain",
+      "    text",
+      "",
+      "- if a",
+      "  one",
+      "- else",
+      "  two",
+      "/ comment",
+      "  body",
+    ] * 20)
+
+    html = self.p.parse_parallel(template, processes=3, min_chunk_lines=10)
+    expected = self.p.parse(template)
+
+    assert html.render() == expected.render()
+    assert len(html.children) == len(expected.children)
+    assert html.children[-1].line_start == expected.children[-1].line_start
+
+    try:
+      self.p.parse_parallel(template + "\n%p\n      %a", processes=3, min_chunk_lines=10)
+      assert False
+    except ParseError as pe:
+      assert pe.line_number == 222
+      assert "indentation" in pe.message
+
+    # Errors found while measuring the indentation
+    long_lines = Parser({"engine": ENGINE_DJANGO, "max_line_length": 100})
+
+    for p, line_number, message in ((long_lines, 222, "too long"), (self.p, 223, "Mismatched")):
+      text = template + "\n%p\n  %a " + "x" * 500 + "\n\t %b"
+
+      try:
+        p.parse_parallel(text, processes=2, min_chunk_lines=10)
+        assert False
+      except ParseError as pe:
+        assert pe.line_number == line_number
+        assert message in pe.message
+
+    # Errors raised in a worker are pickled to get back here
+    pe = pickle.loads(pickle.dumps(ParseError("reason", line_number=3, line="%p")))
+    assert (pe.message, pe.line_number, pe.line) == ("reason", 3, "%p")
+
+    # Blocks aren't split from the blocks they're linked to by blank lines or comments
+    for template in ("%p\n%p\n- if a\n  one\n/ c\n- else\n  two",
+        "%p\n%p\n- if a\n  one\n\n/ c\n- else\n  two\n%p"):
+      html = self.p.parse_parallel(template, processes=2, min_chunk_lines=2)
+      assert html.render() == self.p.parse(template).render()
+
+    with self.assertRaises(ValueError):
+      Parser({"filters": {"f": lambda body: body}}).parse_parallel("%p\n" * 10, processes=2, min_chunk_lines=2)
+
+  def test_filter_spans(self):
+    text = "%p\r\n:javascript\r\n  var a;\r\n\r\n    var b;\r\n-# comment\n   body\n%a"
+    html = self.p.parse(text)
+
+    script, comment = html.children[1], html.children[2]
+    assert script.children == []
+    assert script.source is text
+    assert len(script.spans) == 6
+    assert script.render() == '<script type="text/javascript">var a;\n\n  var b;</script>'
+    assert (script.line_start, script.line_end) == (2, 5)
+
+    # The text on the same line as a comment is still a child
+    assert len(comment.children) == 1
+    assert comment.render() == "<!-- comment\n body -->"
+
+  def test_lean(self):
+    template = """
+!!!
+%html
+
+  %body
+    / a comment that isn't rendered
+      %p with some lines
+
+      in it
+    - if a
+      %p one
+
+    / comments don't break up blocks
+    - else
+      :plain
+        two
+
+        three
+    -# rendered comment
+"""
+
+    lean = Parser({"engine": ENGINE_DJANGO, "lean": True})
+    full = Parser({"engine": ENGINE_DJANGO})
+
+    html = lean.parse(template)
+    expected = full.parse(template).render()
+    assert html.render() == expected
+
+    body = html.children[1].children[0]
+    assert [type(e) for e in html.children] == [Text, Tag]
+    assert [type(e) for e in body.children] == [Block, Block, Comment]
+    assert body.children[1].linked_to is body.children[0]
+
+    out = StringIO()
+    lean.parse_stream(StringIO(template), out)
+    assert out.getvalue() == expected
+
+    # Edits in lines that aren't in the tree
+    edited = template.replace("    / comments don't break up blocks\n", "")
+    html = lean.reparse(lean.parse(template), edited, [(13, 13)])
+    assert html.render() == expected
+    assert html.line_end == len(edited.split("\n"))
+
+    html = lean.parse("%a\n\n/ c\n  x\n%b")
+    html = lean.reparse(html, "%a\n%p\n/ c\n  x\n%b", [(2, 2)])
+    assert html.render() == "<a></a><p></p><b></b>"
+
+    html = lean.reparse(html, "%a\n%p\n%i\n  x\n%b", [(3, 3)])
+    assert html.render() == "<a></a><p></p><i>x</i><b></b>"
+
+  def test_limits(self):
+    def parse_error(options, text):
+      try:
+        Parser(options).parse(text)
+      except ParseError as pe:
+        return pe
+
+      assert False, "no ParseError was raised"
+
+    # Deep nesting
+    deep = "\n".join(" " * i + "%div" for i in range(2000))
+    pe = parse_error({"max_depth": 100}, deep)
+    assert pe.line_number == 101
+    assert "nested" in pe.message
+    assert len(Parser({"max_depth": 100}).parse("\n".join(deep.split("\n")[:100])).children) == 1
+
+    # Long lines aren't copied into the error
+    pe = parse_error({"max_line_length": 1000}, "%p ok\n%p " + "x" * 10 ** 6)
+    assert pe.line_number == 2
+    assert len(str(pe)) < 2000
+
+    pe = parse_error({"max_line_length": 1000}, "%p(\n%p " + "x" * 10 ** 6)
+    assert pe.line_number == 1
+
+    # Lots of elements
+    pe = parse_error({"max_nodes": 1000}, "%p\n" * 10 ** 5)
+    assert pe.line_number == 1001
+
+    # The limit is for the whole tree, not each chunk or edit
+    p = Parser({"max_nodes": 3000})
+
+    try:
+      p.parse_parallel("%p\n" * 5000, processes=2, min_chunk_lines=1000)
+      assert False
+    except ParseError as pe:
+      assert pe.line_number == 3001
+
+    assert len(p.parse_parallel("%p\n" * 2999, processes=2, min_chunk_lines=1000).children) == 2999
+
+    p = Parser({"max_nodes": 10})
+    html = p.parse("\n".join(["%p\n  %a"] * 5))
+
+    try:
+      p.reparse(html, "\n".join(["%p\n  %a"] * 4 + ["%p\n  %a\n  %b"]), [(9, 10)])
+      assert False
+    except ParseError as pe:
+      assert pe.line_number == 11
+
+    text = "\n".join(["%p\n  %a"] * 4 + ["%p"])
+    assert p.reparse(html, text, [(9, 10)]).render() == p.parse(text).render()
+
+    # Lots of attributes
+    attrs = " ".join("data-%s=1" % ("a" * i) for i in range(1, 200))
+    pe = parse_error({"max_attributes": 50}, "%%p\n%%div(%s)" % attrs)
+    assert pe.line_number == 2
+    assert "attributes" in pe.message
+
+    # Large templates are rejected before they are parsed
+    pe = parse_error({"max_input_size": 10 ** 4}, "%p\n" * 10 ** 5)
+    assert pe.line_number is None
+
+    with self.assertRaises(ParseError):
+      Parser({"max_input_size": 10 ** 4}).parse_stream(StringIO("%p\n" * 10 ** 5), StringIO())
+
+    with self.assertRaises(ParseError):
+      Parser({"max_nodes": 1000}).parse_stream(StringIO("%p\n" * 10 ** 5), StringIO())
+
+    # A huge line in a stream is never read in whole
+    class Reader(StringIO):
+      longest = 0
+
+      def readline(self, limit=-1):
+        line = StringIO.readline(self, limit)
+        Reader.longest = max(Reader.longest, len(line))
+        return line
+
+    for options in ({"max_line_length": 1000}, {"max_input_size": 10 ** 4}):
+      with self.assertRaises(ParseError):
+        Parser(options).parse_stream(Reader("%p ok\n%p " + "x" * 10 ** 6), StringIO())
+
+      assert Reader.longest <= 10 ** 4 + 1
+
+    # Filter lines aren't elements, whether the template is streamed or not
+    template = "%p\n:plain\n" + "  line\n" * 100
+    Parser({"max_nodes": 10}).parse(template)
+    Parser({"max_nodes": 10}).parse_stream(StringIO(template), StringIO())
+
+  def test_compiled_filters(self):
+    calls = []
+
+    def shout(body):
+      calls.append(body)
+      return "<b>%s</b>" % body.upper()
+
+    template = """
+%div
+  :shout
+    hello
+      world
+%p
+  :shout
+    hello
+      world
+"""
+
+    p = Parser({"filters": {"shout": shout}})
+    html = p.parse(template).render()
+    assert html == "<div><b>HELLO\n  WORLD</b></div><p><b>HELLO\n  WORLD</b></p>"
+    assert calls == ["hello\n  world"]
+
+    out = StringIO()
+    p.parse_stream(StringIO(template), out)
+    assert out.getvalue() == html
+    assert calls == ["hello\n  world"]
+
+    p = Parser({"filters": {"none": lambda body: None}})
+
+    for template, line_number in ((":none\n  body", 1), ("%div\n  :none\n    body\n%p", 2)):
+      with self.assertRaises(ParseError) as cm:
+        p.parse(template)
+
+      assert cm.exception.line_number == line_number
+      assert ":none" in cm.exception.message
+      assert cm.exception.line == ":none"
+      assert "NoneType" in cm.exception.message
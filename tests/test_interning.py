@@ -0,0 +1,58 @@
+import unittest
+
+from hamplify.element import *
+from hamplify.config import *
+from hamplify.interning import SubtreeInterner
+from hamplify.parsers.parser import Parser
+
+class TestInterning(unittest.TestCase):
+  nav = """
+%nav#top.navbar
+  %ul
+    %li
+      %a(href="/") Home
+    %li
+      %a(href="/about") About
+"""
+
+  def test_intern(self):
+    p = Parser({"engine": ENGINE_DJANGO})
+    first = p.parse(self.nav + "%p first\n%p same")
+    second = p.parse("- block content\n  %p second" + self.nav + "%p same")
+    expected = (first.render(), second.render())
+
+    interner = SubtreeInterner()
+    interner.intern(first)
+    interner.intern(second)
+
+    assert (first.render(), second.render()) == expected
+
+    nav = [e for e in first.children if isinstance(e, Tag)]
+    assert nav[0] is [e for e in second.children if isinstance(e, Tag)][0]
+    assert nav[-1] is second.children[-1]
+    assert second.last_child is nav[-1]
+
+    items = nav[0].children[0].children
+    assert items[0] is not items[1]
+
+    assert interner.shared > 0
+    assert interner.bytes_saved > 0
+    assert "subtrees shared" in interner.report()
+
+  def test_intern_option(self):
+    interner = SubtreeInterner()
+    p = Parser({"interner": interner})
+
+    first = p.parse("%p(a='1') text")
+    second = p.parse("%p(a='1') text\n%p(a=\"1\") text")
+    assert first.children[0] is second.children[0]
+    assert second.children[0] is not second.children[1]
+
+  def test_intern_parallel(self):
+    interner = SubtreeInterner()
+    p = Parser({"interner": interner})
+
+    html = p.parse_parallel("%p a\n%p b\n" * 50, processes=2, min_chunk_lines=10)
+    assert html.children[0] is html.children[-2]
+    assert len(interner.table) > 0
+    assert interner.shared > 0
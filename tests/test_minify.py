@@ -0,0 +1,227 @@
+import re
+import time
+import unittest
+
+try:
+  from html.parser import HTMLParser
+except ImportError:
+  from HTMLParser import HTMLParser
+
+from hamplify.cache import ContentCache
+from hamplify.config import *
+from hamplify.minify import minify_css, minify_html, minify_js
+from hamplify.parsers.parser import Parser
+
+class EventParser(HTMLParser):
+  """ Turns html into a list of the tags, text and comments in it. Whitespace in text
+  is collapsed, except in elements where it matters
+  """
+
+  def __init__(self):
+    HTMLParser.__init__(self)
+
+    self.events = []
+    self.raw = 0
+
+  def handle_starttag(self, tag, attrs):
+    self.events.append(("start", tag, attrs))
+
+    if tag in ("pre", "textarea"):
+      self.raw += 1
+
+  def handle_startendtag(self, tag, attrs):
+    self.events.append(("start", tag, attrs))
+
+  def handle_endtag(self, tag):
+    self.events.append(("end", tag))
+
+    if tag in ("pre", "textarea"):
+      self.raw -= 1
+
+  def handle_data(self, data):
+    if not self.raw:
+      data = re.sub(r"[ \t\n\r\f]+", " ", data)
+
+    if self.events and self.events[-1][0] == "data":
+      self.events[-1] = ("data", self.events[-1][1] + data)
+    else:
+      self.events.append(("data", data))
+
+  def handle_comment(self, data):
+    self.events.append(("comment", data))
+
+  def handle_decl(self, decl):
+    self.events.append(("decl", re.sub(r"[ \t\n\r\f]+", " ", decl)))
+
+def events(html):
+  p = EventParser()
+  p.feed(html)
+  p.close()
+
+  return p.events
+
+class TestMinify(unittest.TestCase):
+  corpus = [
+    """
+!!! 5
+%html
+  %head
+    %title   My   page
+    %meta(charset="utf-8")
+    :css
+      p  {  color: red;  }
+  %body#main.page(data-x="1.5" title='two words')
+    %h1 Header
+    %span(title="a b") 1&nbsp;000 \xa0 \xa0 kg
+    %p
+      Some text
+      that goes over
+      a few lines
+    - if user
+      %a(href="/users/{{user.id}}")= user.name
+    - else
+      %a(href="/login" class="btn btn-primary") Log in
+    %pre
+      :plain
+        keep   this
+          exactly
+    %textarea(name="comment")
+      :plain
+        and   this
+    :javascript
+      var  a = "  b  ";
+    %br(class="x")
+    %input(value="a/b" disabled)
+    -# a   comment
+""",
+    """
+%ul
+  - for item in items
+    %li.item(data-id="{{ item.id }}")
+      %span= item.name
+      {# a   comment #}
+      {% include   "row.html" %}
+""",
+  ]
+
+  def test_equivalent(self):
+    p = Parser({"engine": ENGINE_DJANGO})
+
+    for template in self.corpus:
+      html = p.parse(template).render()
+      minified = minify_html(html)
+
+      assert events(minified) == events(html)
+      assert len(minified) < len(html)
+
+  def test_minify(self):
+    assert minify_html("<p   class=\"a\"  id='b c'>\n  x  y\n</p>") == "<p class=a id='b c'> x y </p>"
+    assert minify_html('<br class="a"/><a href="{{ url }}">') == '<br class="a"/><a href="{{ url }}">'
+    assert minify_html("<pre>  a\n  b</pre>  <PRE>\n x</PRE>") == "<pre>  a\n  b</pre> <PRE>\n x</PRE>"
+    assert minify_html("{%  if a > b  %}  {{  x  }}") == "{%  if a > b  %} {{  x  }}"
+    assert minify_html("<!--  a  -->  <script>  var a;  </script>") == "<!--  a  --> <script>  var a;  </script>"
+
+    # Non-breaking spaces show up on the page, so they aren't whitespace
+    assert minify_html("<p>a\xa0\xa0b  \xa0 c</p>") == "<p>a\xa0\xa0b \xa0 c</p>"
+    assert minify_html('<p class="a"\xa0 id="b"></p>') == '<p class="a"\xa0 id=b></p>'
+
+  def test_minify_unclosed(self):
+    # None of these are closed, so they're left as they are. Each one used to backtrack
+    # through the rest of the html, some of them from every `<` in it
+    template = "%p\n  if a<b " + "{{x}}" * 16 + " it's true"
+    hostile = [
+      "<a " + "{{x}}" * 16,
+      minify_html(Parser({"minify": True}).parse(template).render()),
+      "a <b " * 4000,
+      '<a "' * 4001 + ">",
+      "<!--" * 5000,
+      "{{ " * 5000,
+    ]
+
+    start = time.time()
+
+    for html in hostile:
+      assert minify_html(html) == html
+
+    assert time.time() - start < 1
+
+    assert minify_html("<a {{ x>  <b>{{ y }}  <i  a='b'>") == "<a {{ x>  <b>{{ y }} <i a=b>"
+
+  def test_minify_css(self):
+    assert minify_css("/* c */ a :hover , p > b {\n  color : red ;\n  margin: 0  auto !important;\n}") \
+      == "a :hover,p>b{color :red;margin:0 auto!important}"
+    assert minify_css("p { width: calc(1px + 2px); content: 'a  ; }' }") \
+      == "p{width:calc(1px + 2px);content:'a  ; }'}"
+    assert minify_css("@media screen and (max-width: 10px) { a { b: c; } }") \
+      == "@media screen and (max-width:10px){a{b:c}}"
+
+  def test_minify_js(self):
+    assert minify_js("var a = 1 ,  // one\n    b = 'x  y';") == "var a=1,b='x  y';"
+    assert minify_js("x = a + +b - -c / 2 / d") == "x=a+ +b- -c/2/d"
+    assert minify_js("var re = /[/]+ab/gi  ,  c = /x/ in o") == "var re=/[/]+ab/gi,c=/x/ in o"
+    assert minify_js("function f (x) {\n  return x\n    + 1\n}") == "function f(x){return x\n+1}"
+    assert minify_js("a++\nb\nreturn\n/* a\n b */\nc") == "a++\nb\nreturn\nc"
+    assert minify_js("y = 1 .toString()") == "y=1 .toString()"
+
+    # A / after a parenthesis is division, unless it closes an if/while/for/with
+    assert minify_js("if (x) /a  b/.test(y)") == "if(x)/a  b/.test(y)"
+    assert minify_js("while (f(x)) /a b/g.exec(s)") == "while(f(x))/a b/g.exec(s)"
+    assert minify_js("x = f(a) / 2 / c ,  y = a[0] / 2 / b") == "x=f(a)/2/c,y=a[0]/2/b"
+
+    # Can't be done safely
+    assert minify_js("  var t = `a ${b}`;  ") == "var t = `a ${b}`;"
+    assert minify_js("if (x) {} /a  b/.test(y)") == "if (x) {} /a  b/.test(y)"
+
+  def test_minify_filters(self):
+    template = """
+%head
+  :css
+    p {
+      color: red;
+    }
+  :javascript
+    var a = 1;
+
+    f( a );
+%body
+  :css
+    p {
+      color: red;
+    }
+"""
+
+    p = Parser({"minify": True})
+    html = p.parse(template).render()
+
+    assert html == ('<head><style type="text/css">p{color:red}</style>'
+      '<script type="text/javascript">var a=1;f(a);</script></head>'
+      '<body><style type="text/css">p{color:red}</style></body>')
+    assert p.content_cache.hits == 1
+    assert p.content_cache.misses == 2
+
+  def test_content_cache(self):
+    calls = []
+
+    def func(text):
+      calls.append(text)
+      return None if text == "none" else text.upper()
+
+    cache = ContentCache(2)
+    assert cache.get(func, "a") == "A"
+    assert cache.get(func, "none") is None
+    assert cache.get(func, "none") is None
+    assert cache.get(func, "a") == "A"
+    assert calls == ["a", "none"]
+
+    # The least recently used result is dropped
+    cache.get(func, "b")
+    assert len(cache.results) == 2
+    cache.get(func, "a")
+    cache.get(func, "none")
+    assert calls == ["a", "none", "b", "none"]
+
+    cache = ContentCache(0)
+    cache.get(func, "a")
+    cache.get(func, "a")
+    assert calls[-2:] == ["a", "a"]
+    assert not cache.results
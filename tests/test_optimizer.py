@@ -0,0 +1,56 @@
+import unittest
+
+from hamplify.element import *
+from hamplify.config import *
+from hamplify.optimizer import fold_static
+from hamplify.parsers.parser import Parser
+
+class TestOptimizer(unittest.TestCase):
+  template = """
+!!! 5
+%html
+  %head
+    %title Title
+    :css
+      p { color: red; }
+  %body#main.page(data-x="1")
+    %h1 Header
+    %p
+      - if user
+        Hello
+        %b= user.name
+      - else
+        %a(href="/login") Log in
+    %ul
+      %li one
+      %li two
+"""
+
+  def test_fold_static(self):
+    p = Parser({"engine": ENGINE_DJANGO})
+    expected = p.parse(self.template).render()
+
+    root = fold_static(p.parse(self.template))
+    assert root.render() == expected
+
+    # Everything up to the <p> is static, and so is the <ul> after it
+    html = root.children
+    assert [type(e) for e in html] == [Text, Tag]
+
+    body = html[1].children[-1]
+    assert [type(e) for e in body.children] == [Text, Tag, Text]
+    assert body.children[0].render() == "<h1>Header</h1>"
+
+    if_block = body.children[1].children[0]
+    assert [type(e) for e in if_block.children] == [Text, Tag]
+    assert [type(e) for e in if_block.children[1].children] == [Variable]
+    assert body.children[1].last_child.name == "else"
+
+  def test_fold_static_option(self):
+    template = "%div\n  %p one\n\n  %p two"
+    root = Parser({"fold_static": True}).parse(template)
+
+    assert [type(e) for e in root.children] == [Text]
+    assert root.render() == "<div><p>one</p><p>two</p></div>"
+    assert root.children[0].line_start == 1
+    assert root.children[0].line_end == 4
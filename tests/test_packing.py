@@ -0,0 +1,85 @@
+import pickle
+import unittest
+
+from hamplify.element import *
+from hamplify.element import _get_slot_names
+from hamplify.config import *
+from hamplify.packing import *
+from hamplify.parsers.parser import Parser
+
+class TestPackedElements(unittest.TestCase):
+  template = """
+!!! 5
+%html
+  %body#main.page(data-x="1")
+    / not rendered
+      %p hidden
+    -# rendered comment
+    %ul
+      - for item in items
+        %li= item
+
+      - empty
+        %li none
+    - if a
+      one
+    - elif b
+      two
+    - else
+      - cycle 'a' 'b'
+    :javascript
+      var a = 1;
+
+      a++;
+    %br
+%p done
+"""
+
+  def check(self, old, new):
+    """ Compares two trees slot by slot
+    """
+
+    assert type(old) is type(new)
+
+    for name in _get_slot_names(type(old)):
+      a, b = getattr(old, name), getattr(new, name)
+
+      if name == "children":
+        assert len(a) == len(b)
+
+        for x, y in zip(a, b):
+          assert y.parent is new
+          self.check(x, y)
+      elif name == "last_child":
+        assert a is b is None or old.children.index(a) == new.children.index(b)
+      elif name == "linked_to":
+        assert a is b is None or old.parent.children.index(a) == new.parent.children.index(b)
+      elif name == "attrs" and a is not None:
+        # Attribute's __eq__ is for comparing against strings
+        fields = lambda attrs: [(k, v.name, v.value, v.quote_char) for k, v in attrs.items()]
+        assert fields(a) == fields(b)
+      elif name != "parent":
+        assert a == b
+
+  def count(self, e):
+    return 1 + sum(self.count(child) for child in getattr(e, "children", ()))
+
+  def test_pack(self):
+    root = Parser({"engine": ENGINE_DJANGO}).parse(self.template)
+    packed = pickle.loads(pickle.dumps(PackedElements.pack(root.children)))
+    children = packed.unpack()
+
+    assert len(packed) == self.count(root) - 1
+    assert len(children) == len(root.children)
+
+    for old, new in zip(root.children, children):
+      assert new.parent is None
+      self.check(old, new)
+
+    copy = RootNode()
+
+    for e in children:
+      copy.add_child(e)
+
+    assert copy.render() == root.render()
+    assert PackedElements.pack([]).unpack() == []
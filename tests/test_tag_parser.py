@@ -34,7 +34,7 @@ class TestTagParser(unittest.TestCase):
     e = self.tp.parse("%button")
     assert type(e) is Tag
     assert e.tag == "button"
-    assert e.classes == []
+    assert not e.classes
     assert e.id == None
     assert e.children == []
 
@@ -115,6 +115,18 @@ class TestTagParser(unittest.TestCase):
     assert (self.tp.parse("%a.class#id(href='#'  target=\"blank\" data-blah=1234 required )").render()
       == '<a id="id" class="class" href=\'#\' target="blank" data-blah=1234 required></a>')
 
+  def test_freeze(self):
+    with self.assertRaises(ParseError):
+      self.tp.parse("#id(id='another-id')")
+
+    e = self.tp.parse("%p.a(title='x') text")
+    assert e.opening == "<p class=\"a\" title='x'>"
+    assert e.closing == "</p>"
+
+    e.add_class("b")
+    assert e.opening is None
+    assert e.render() == "<p class=\"a b\" title='x'>text</p>"
+
   def test_self_closing_tag(self):
     e = self.tp.parse("%br")
     assert type(e) is SelfClosingTag
@@ -133,4 +145,51 @@ class TestTagParser(unittest.TestCase):
     assert e.render() == "<p>= after the tag</p>"
 
     e = self.tp.parse("%a(href='#')= mylink")
-    assert e.render() == "<a href='#'>{{mylink}}</a>"
\ No newline at end of file
+    assert e.render() == "<a href='#'>{{mylink}}</a>"
+
+  def test_error_messages(self):
+    errors = {
+      "%": "Encountered a blank tag, expected a name",
+      "%1p": "Expected a name for the tag, but instead found '1'",
+      "%p.": "Encountered an empty class name",
+      "%p#a#b": "Element cannot have more than 1 ID",
+    }
+
+    for text, message in errors.items():
+      with self.assertRaises(ParseError) as cm:
+        self.tp.parse(text)
+
+      self.assertEqual(cm.exception.message, message)
+
+  def test_line_cache(self):
+    tp = TagParser({"line_cache_size": 2})
+
+    first = tp.parse("%p.a(title='x') text")
+    second = tp.parse("%p.a(title='x') text")
+    assert first is not second
+    assert second.render() == first.render() == "<p class=\"a\" title='x'>text</p>"
+    assert (tp.line_cache.hits, tp.line_cache.misses) == (1, 1)
+
+    # Copies don't share anything that can be changed
+    second.add_class("b")
+    second.set_attribute("title", "y")
+    second.children[0].set_text("changed")
+    assert tp.parse("%p.a(title='x') text").render() == first.render()
+
+    tp.parse(".b")
+    tp.parse("#c")
+    assert len(tp.line_cache.lines) == 2
+    assert "%p.a(title='x') text" not in [key[0] for key in tp.line_cache.lines]
+
+    # The options are part of the key
+    tp = TagParser({"engine": ENGINE_DJANGO})
+    assert tp.parse("%p= x").render() == "<p>{{x}}</p>"
+    del tp.options["engine"]
+
+    with self.assertRaises(ParseError):
+      tp.parse("%p= x")
+
+    tp = TagParser({"line_cache_size": 0})
+    tp.parse("%p")
+    tp.parse("%p")
+    assert (tp.line_cache.hits, tp.line_cache.misses) == (0, 0)